@@ -0,0 +1,55 @@
+"""Подавление повторяющихся сообщений об ошибках."""
+import os
+import time
+import traceback
+
+ALERT_WINDOW = float(os.getenv('ALERT_WINDOW', 60 * 60))
+
+
+def error_fingerprint(error):
+    """Отпечаток ошибки: тип исключения и место, где оно возникло.
+
+    Текст ошибки в отпечаток не входит, поэтому сообщения, которые
+    отличаются только деталями запроса, считаются одной ошибкой.
+    """
+    origin = ''
+    if error.__traceback__ is not None:
+        frame = traceback.extract_tb(error.__traceback__)[-1]
+        origin = f'{os.path.basename(frame.filename)}:{frame.name}'
+    return f'{type(error).__module__}.{type(error).__qualname__}@{origin}'
+
+
+class AlertSuppressor:
+    """Решает, сообщать ли об ошибке в чат.
+
+    О новой ошибке сообщается сразу. Повторы той же ошибки только
+    считаются, и раз в window секунд уходит сводка с их числом.
+    Ошибка, не повторявшаяся window секунд, считается прошедшей.
+    """
+
+    __slots__ = ('window', 'clock', '_errors')
+
+    def __init__(self, window=ALERT_WINDOW, clock=time.monotonic):
+        """Начинает без известных ошибок; время берётся из clock."""
+        self.window = window
+        self.clock = clock
+        self._errors = {}
+
+    def check(self, error):
+        """Возвращает текст для отправки или None, если ошибку подавить."""
+        now = self.clock()
+        for key, (_, _, last_seen) in list(self._errors.items()):
+            if now - last_seen >= self.window:
+                del self._errors[key]
+        key = error_fingerprint(error)
+        if key not in self._errors:
+            self._errors[key] = [now, 0, now]
+            return f'Сбой в работе программы: {error}'
+        entry = self._errors[key]
+        entry[1] += 1
+        entry[2] = now
+        if now - entry[0] < self.window:
+            return None
+        repeats, entry[0], entry[1] = entry[1], now, 0
+        return (f'Сбой всё ещё повторяется ({repeats} раз за '
+                f'{int(self.window // 60)} мин): {error}')
@@ -0,0 +1,242 @@
+"""Нагрузочный прогон цикла опроса на локальных заглушках API.
+
+Поднимает HTTP-заглушку API Практикума и поддельный Telegram Bot API,
+затем гоняет настоящий конвейер get_api_answer -> check_response ->
+parse_status -> send_message для заданного числа подписок и печатает
+число циклов в секунду, p50/p99 задержки цикла и потребление памяти.
+
+    python benchmarks/bench_pipeline.py --tenants 200 --cycles 5
+"""
+import argparse
+import json
+import os
+import resource
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import homework  # noqa: E402
+import http_client  # noqa: E402
+import journal  # noqa: E402
+from state import TenantState  # noqa: E402
+
+STATUSES = ('reviewing', 'rejected', 'approved')
+
+
+class QuietHandler(BaseHTTPRequestHandler):
+    """Обработчик без записи каждого запроса в stderr."""
+
+    latency = 0
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        """Запросы заглушек не логируются."""
+
+    def reply(self, payload, status=200):
+        """Отвечает JSON после заданной задержки."""
+        if self.latency:
+            time.sleep(self.latency)
+        body = payload if isinstance(payload, bytes) else (
+            json.dumps(payload).encode())
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class PracticumHandler(QuietHandler):
+    """Заглушка API: payload_size работ, статус меняется каждый запрос."""
+
+    payload_size = 1
+    recorded = ()
+    requests = 0
+    lock = threading.Lock()
+
+    def do_GET(self):
+        """Отдаёт список работ со сменяющимся статусом.
+
+        Если загружен журнал, по кругу отдаёт записанные в нём ответы.
+        """
+        with self.lock:
+            type(self).requests += 1
+            number = type(self).requests
+        if self.recorded:
+            entry = self.recorded[number % len(self.recorded)]
+            self.reply(entry.body, entry.status)
+            return
+        homeworks = [
+            {
+                'id': index,
+                'homework_name': f'user__hw{index}.zip',
+                'status': STATUSES[(number + index) % len(STATUSES)],
+                'reviewer_comment': 'Комментарий ревьюера ' * 4,
+                'date_updated': '2020-02-13T14:40:57Z',
+                'lesson_name': 'Итоговый проект',
+            }
+            for index in range(self.payload_size)
+        ]
+        self.reply({'homeworks': homeworks, 'current_date': int(time.time())})
+
+
+class TelegramHandler(QuietHandler):
+    """Поддельный Telegram Bot API: принимает sendMessage."""
+
+    def do_POST(self):
+        """Отвечает так же, как sendMessage настоящего API."""
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        self.reply({'ok': True, 'result': {
+            'message_id': 1,
+            'date': int(time.time()),
+            'chat': {'id': 1, 'type': 'private'},
+            'text': 'ok',
+        }})
+
+
+class Server(ThreadingHTTPServer):
+    """HTTP-сервер заглушки с очередью соединений под нагрузку."""
+
+    daemon_threads = True
+    request_queue_size = 1024
+
+
+def start_server(handler):
+    """Запускает заглушку на свободном порту в фоновом потоке."""
+    server = Server(('127.0.0.1', 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def percentile(values, fraction):
+    """Перцентиль отсортированного списка."""
+    if not values:
+        return 0
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def poll_cycle(bot, tenant):
+    """Один цикл опроса подписки по настоящему конвейеру бота."""
+    started = time.perf_counter()
+    api_answer = homework.request_api(tenant.headers, tenant.timestamp).json()
+    records = homework.check_response(api_answer)
+    changes = tenant.homeworks.diff(records)
+    for record in changes:
+        homework.send_to_chat(bot, tenant.chat_id,
+                              homework.parse_status(record))
+        tenant.homeworks.remember(record)
+    return time.perf_counter() - started
+
+
+def run_benchmark(tenants=100, cycles=3, workers=32, api_latency=0.0,
+                  telegram_latency=0.0, payload_size=1, recorded=()):
+    """Прогоняет cycles циклов для tenants подписок и возвращает отчёт.
+
+    recorded — записи журнала ответов API; если заданы, заглушка
+    отдаёт их вместо сгенерированных ответов.
+    """
+    import telegram
+    from telegram.utils.request import Request
+
+    PracticumHandler.payload_size = payload_size
+    practicum = start_server(type('Practicum', (PracticumHandler,), {
+        'latency': api_latency, 'recorded': tuple(recorded)}))
+    fake_telegram = start_server(type(
+        'Telegram', (TelegramHandler,), {'latency': telegram_latency}))
+    endpoint, client = homework.ENDPOINT, http_client._client
+    http_client._client = http_client.HttpClient(pool_maxsize=workers)
+    homework.ENDPOINT = (f'http://127.0.0.1:{practicum.server_port}'
+                         '/api/user_api/homework_statuses/')
+    bot = telegram.Bot(
+        token='1234:bench',
+        base_url=f'http://127.0.0.1:{fake_telegram.server_port}/bot',
+        request=Request(con_pool_size=workers))
+    subscriptions = [
+        TenantState(f'token-{number}', number) for number in range(tenants)
+    ]
+    results = []
+    started = time.perf_counter()
+
+    def cycle(tenant):
+        try:
+            return poll_cycle(bot, tenant)
+        except Exception:
+            return None
+
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for _ in range(cycles):
+                results += executor.map(cycle, subscriptions)
+    finally:
+        http_client._client.close()
+        homework.ENDPOINT, http_client._client = endpoint, client
+        practicum.shutdown()
+        fake_telegram.shutdown()
+    elapsed = time.perf_counter() - started
+    latencies = sorted(result for result in results if result is not None)
+    return {
+        'tenants': tenants,
+        'cycles': len(latencies),
+        'errors': len(results) - len(latencies),
+        'cycles_per_second': round(len(latencies) / elapsed, 1),
+        'p50_ms': round(percentile(latencies, 0.5) * 1000, 2),
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 2),
+        'max_rss_mb': round(
+            resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    }
+
+
+def check_regression(report, baseline_path, tolerance):
+    """Сравнивает отчёт с сохранённым; возвращает список регрессий."""
+    with open(baseline_path, encoding='utf-8') as file:
+        baseline = json.load(file)
+    problems = []
+    if report['cycles_per_second'] < (
+            baseline['cycles_per_second'] * (1 - tolerance)):
+        problems.append('cycles_per_second')
+    for key in ('p50_ms', 'p99_ms'):
+        if report[key] > baseline[key] * (1 + tolerance):
+            problems.append(key)
+    return problems
+
+
+def main():
+    """Разбирает аргументы, запускает прогон и печатает отчёт."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--tenants', type=int, default=100)
+    parser.add_argument('--cycles', type=int, default=3)
+    parser.add_argument('--workers', type=int, default=32)
+    parser.add_argument('--api-latency', type=float, default=0.0,
+                        help='задержка ответа API, секунд')
+    parser.add_argument('--telegram-latency', type=float, default=0.0,
+                        help='задержка ответа Telegram, секунд')
+    parser.add_argument('--payload-size', type=int, default=1,
+                        help='число работ в ответе API')
+    parser.add_argument('--journal',
+                        help='журнал ответов API для заглушки Практикума')
+    parser.add_argument('--baseline', help='JSON-отчёт для сравнения')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help='допустимое ухудшение относительно baseline')
+    args = parser.parse_args()
+    report = run_benchmark(
+        tenants=args.tenants,
+        cycles=args.cycles,
+        workers=args.workers,
+        api_latency=args.api_latency,
+        telegram_latency=args.telegram_latency,
+        payload_size=args.payload_size,
+        recorded=journal.read_journal(args.journal) if args.journal else (),
+    )
+    print(json.dumps(report, ensure_ascii=False))
+    if args.baseline:
+        problems = check_regression(report, args.baseline, args.tolerance)
+        if problems:
+            sys.exit(f'Регрессия производительности: {", ".join(problems)}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,186 @@
+"""Команды чатов, на которые бот отвечает из своего состояния.
+
+Ответы строятся только по состоянию подписок в памяти (оно же
+восстанавливается из хранилища), к API Практикума команды не обращаются.
+Обновления Telegram получаются long polling-ом в отдельном потоке,
+поэтому ожидание команд не задерживает опрос API.
+"""
+import logging
+import os
+import threading
+import time
+
+BOT_COMMANDS = os.getenv('BOT_COMMANDS', '').lower() in ('1', 'true', 'yes')
+COMMANDS_POLL_TIMEOUT = int(os.getenv('COMMANDS_POLL_TIMEOUT', 30))
+COMMANDS_RETRY_DELAY = float(os.getenv('COMMANDS_RETRY_DELAY', 5))
+
+HELP = (
+    '/status — статусы ваших работ\n'
+    '/last — последнее изменение статуса\n'
+    '/pause — приостановить опрос и уведомления\n'
+    '/resume — возобновить опрос'
+)
+
+logger = logging.getLogger(__name__)
+
+
+def ago(seconds):
+    """Давность события словами."""
+    seconds = max(0, int(seconds))
+    if seconds < 60:
+        return 'только что'
+    if seconds < 3600:
+        return f'{seconds // 60} мин назад'
+    if seconds < 86400:
+        return f'{seconds // 3600} ч назад'
+    return f'{seconds // 86400} дн назад'
+
+
+class Commands:
+    """Отвечает на команды чатов по состоянию их подписок.
+
+    Команды из чатов без подписки игнорируются. У чата может быть
+    несколько подписок (например, общий чат группы): команда относится
+    ко всем. verdicts — тексты вердиктов по статусам, как
+    в HOMEWORK_VERDICTS. Пауза сохраняется в storage, если оно задано.
+    """
+
+    def __init__(self, tenants, verdicts, clock=time.time, storage=None):
+        """Группирует подписки по чатам; clock — источник текущего времени."""
+        self.tenants = {}
+        for tenant in tenants:
+            self.tenants.setdefault(str(tenant.chat_id), []).append(tenant)
+        self.verdicts = verdicts
+        self.clock = clock
+        self.storage = storage
+        self.handlers = {
+            '/start': self.help,
+            '/help': self.help,
+            '/status': self.status,
+            '/last': self.last,
+            '/pause': self.pause,
+            '/resume': self.resume,
+        }
+
+    def handle(self, chat_id, text):
+        """Ответ на сообщение чата или None, если отвечать не нужно."""
+        tenants = self.tenants.get(str(chat_id))
+        if tenants is None or not text or not text.startswith('/'):
+            return None
+        command = text.split()[0].split('@')[0].lower()
+        logger.info(f'Команда {command} из чата {chat_id}')
+        return self.handlers.get(command, self.help)(tenants)
+
+    def help(self, tenants):
+        """Список команд."""
+        return HELP
+
+    def status(self, tenants):
+        """Последние известные статусы работ подписок чата."""
+        if len(tenants) == 1:
+            return self._status(tenants[0])
+        return '\n\n'.join(
+            f'Подписка {number}:\n{self._status(tenant)}'
+            for number, tenant in enumerate(tenants, 1))
+
+    def _status(self, tenant):
+        homeworks = tenant.homeworks
+        statuses = dict(homeworks.statuses)
+        if statuses:
+            lines = ['Статусы работ:'] + [
+                f'"{homeworks.name(key)}": {self.verdicts.get(status, status)}'
+                for key, status in statuses.items()
+            ]
+        else:
+            lines = ['Пока нет данных о работах.']
+        lines.append('Последний опрос: '
+                     f'{ago(self.clock() - tenant.last_success)}.')
+        if tenant.paused:
+            lines.append('Опрос приостановлен, вернуть: /resume')
+        return '\n'.join(lines)
+
+    def last(self, tenants):
+        """Последнее замеченное изменение статуса по подпискам чата."""
+        changes = [tenant.last_change for tenant in tenants
+                   if tenant.last_change is not None]
+        if not changes:
+            return 'С запуска бота статусы не менялись.'
+        homework, when = max(changes, key=lambda change: change[1])
+        return (f'Последнее изменение ({ago(self.clock() - when)}):\n'
+                f'"{homework.name}": '
+                f'{self.verdicts.get(homework.status, homework.status)}')
+
+    def pause(self, tenants):
+        """Приостанавливает опрос подписок чата."""
+        self._set_paused(tenants, True)
+        return ('Опрос и уведомления приостановлены. Изменения за это время '
+                'придут после /resume')
+
+    def resume(self, tenants):
+        """Возобновляет опрос подписок чата."""
+        self._set_paused(tenants, False)
+        return 'Опрос возобновлён.'
+
+    def _set_paused(self, tenants, paused):
+        for tenant in tenants:
+            tenant.paused = paused
+            if self.storage is not None:
+                self.storage.stage_paused(tenant)
+
+
+class CommandListener:
+    """Получает команды long polling-ом и отвечает через reply.
+
+    reply(chat_id, text) вызывается из потока слушателя. Ошибки
+    getUpdates не останавливают поток: запрос повторяется через
+    retry_delay секунд.
+    """
+
+    def __init__(self, bot, commands, reply, timeout=COMMANDS_POLL_TIMEOUT,
+                 retry_delay=COMMANDS_RETRY_DELAY):
+        """Готовит поток слушателя; timeout — ожидание getUpdates, секунд."""
+        self.bot = bot
+        self.commands = commands
+        self.reply = reply
+        self.timeout = timeout
+        self.retry_delay = retry_delay
+        self.offset = None
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(
+            target=self._run, name='commands', daemon=True)
+
+    def start(self):
+        """Запускает поток слушателя."""
+        self._thread.start()
+        return self
+
+    def stop(self, timeout=None):
+        """Останавливает слушателя после текущего запроса.
+
+        С timeout ждёт завершения потока не дольше timeout секунд.
+        """
+        self._stopped.set()
+        if timeout is not None:
+            self._thread.join(timeout)
+
+    def poll(self):
+        """Один запрос getUpdates и ответы на полученные команды."""
+        updates = self.bot.get_updates(
+            offset=self.offset, timeout=self.timeout,
+            allowed_updates=['message'])
+        for update in updates:
+            self.offset = update.update_id + 1
+            message = update.message
+            if message is None:
+                continue
+            answer = self.commands.handle(message.chat_id, message.text)
+            if answer is not None:
+                self.reply(message.chat_id, answer)
+
+    def _run(self):
+        while not self._stopped.is_set():
+            try:
+                self.poll()
+            except Exception as error:
+                logger.error(f'Сбой получения команд: {error}')
+                self._stopped.wait(self.retry_delay)
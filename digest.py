@@ -0,0 +1,61 @@
+"""Сбор изменений статусов по чатам в одно сообщение-сводку."""
+import asyncio
+import os
+
+DIGEST_WINDOW = float(os.getenv('DIGEST_WINDOW', 30))
+
+
+class DigestBuffer:
+    """Копит изменения статусов чата window секунд и отправляет сводку.
+
+    Окно открывается первым изменением в чате. Если за окно одна
+    работа сменила статус несколько раз, в сводку попадает последний.
+    При window=0 изменения отправляются сразу. Квитанции, переданные
+    в add(), уходят в очередь вместе со сводкой: очередь отдаёт их
+    обратно, когда Telegram принял сообщение.
+    """
+
+    def __init__(self, outbox, format_digest, window=DIGEST_WINDOW):
+        """Текст сводки собирает format_digest из списка работ."""
+        self.outbox = outbox
+        self.format_digest = format_digest
+        self.window = window
+        self._chats = {}
+        self._timers = {}
+        self._receipts = {}
+
+    def __len__(self):
+        """Число изменений, ждущих сводки, во всех чатах."""
+        return sum(len(homeworks) for homeworks in self._chats.values())
+
+    def add(self, chat_id, homework, receipt=None):
+        """Добавляет изменение статуса в сводку чата."""
+        homeworks = self._chats.get(chat_id)
+        if homeworks is None:
+            homeworks = self._chats[chat_id] = {}
+            if self.window > 0:
+                self._timers[chat_id] = asyncio.get_running_loop().call_later(
+                    self.window, self.flush, chat_id)
+        homeworks.pop(homework.key, None)
+        homeworks[homework.key] = homework
+        if receipt is not None:
+            self._receipts.setdefault(chat_id, []).append(receipt)
+        if self.window <= 0:
+            self.flush(chat_id)
+
+    def flush(self, chat_id):
+        """Отправляет накопленную сводку чата в очередь."""
+        timer = self._timers.pop(chat_id, None)
+        if timer is not None:
+            timer.cancel()
+        homeworks = self._chats.pop(chat_id, None)
+        receipts = self._receipts.pop(chat_id, None)
+        if homeworks:
+            self.outbox.put(
+                chat_id, self.format_digest(list(homeworks.values())),
+                receipts)
+
+    def flush_all(self):
+        """Отправляет сводки всех чатов, не дожидаясь конца окна."""
+        for chat_id in list(self._chats):
+            self.flush(chat_id)
@@ -0,0 +1,430 @@
+"""Асинхронный движок, опрашивающий API Практикума для многих подписок."""
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import zlib
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+import metrics
+from alerts import AlertSuppressor
+from commands import CommandListener
+from digest import DigestBuffer
+from exceptions import BudgetExceeded
+from leases import LeaseCoordinator
+from outbox import Outbox
+from resilience import CircuitBreaker, call_with_retries, is_transient
+from scheduler import PollPolicy, TimingWheel
+from shutdown import SHUTDOWN_SIGNALS, SHUTDOWN_TIMEOUT
+from singleflight import SingleFlight
+from state import TenantState, fingerprint, next_timestamp
+
+POLL_CONCURRENCY = int(os.getenv('POLL_CONCURRENCY', 64))
+STATE_FLUSH_INTERVAL = float(os.getenv('STATE_FLUSH_INTERVAL', 1))
+
+Pipeline = namedtuple(
+    'Pipeline', ('fetch', 'check', 'digest', 'delay'), defaults=(None,))
+Pipeline.__doc__ = """Шаги опроса подписки.
+
+delay(headers) — сколько секунд отложить запрос, чтобы уложиться
+в лимиты запросов к API; None, если лимитов нет.
+"""
+
+logger = logging.getLogger(__name__)
+
+
+class FetchResult:
+    """Ответ API, общий для подписок, которые его дождались.
+
+    Тело разбирается и проверяется один раз, при первом обращении;
+    если ответ совпал с предыдущим, он не разбирается вовсе.
+    """
+
+    __slots__ = ('response', 'digest', 'current_date', '_answer', '_checked')
+
+    def __init__(self, response):
+        """Считает отпечаток тела ответа, не разбирая его."""
+        self.response = response
+        self.digest, self.current_date = fingerprint(response.content)
+        self._answer = None
+        self._checked = None
+
+    def answer(self):
+        """Разобранный JSON ответа."""
+        if self._answer is None:
+            self._answer = self.response.json()
+        return self._answer
+
+    def checked(self, check):
+        """Результат check() для ответа; ошибки проверки не запоминаются."""
+        if self._checked is None:
+            self._checked = check(self.answer()) or []
+        return self._checked
+
+
+def load_tenants(path):
+    """Читает подписки из JSON-файла.
+
+    Файл содержит список объектов с ключами practicum_token и chat_id.
+    """
+    with open(path, encoding='utf-8') as file:
+        entries = json.load(file)
+    return [
+        TenantState(entry['practicum_token'], entry['chat_id'])
+        for entry in entries
+    ]
+
+
+class PollingEngine:
+    """Опрашивает API для всех подписок в одном процессе.
+
+    Сроки опросов хранятся в колесе таймеров: одна задача раз в тик
+    запускает опросы, срок которых наступил, поэтому расписание не
+    зависит от числа подписок. Первый опрос подписки смещён на phase(),
+    дальше интервалы считает PollPolicy.
+    Блокирующие запросы к API выполняются в пуле потоков, число
+    одновременных опросов ограничено concurrency. Изменения статусов
+    собираются в сводки по чатам и уходят через очередь Outbox,
+    не задерживая опрос. Сбои API, общие для всех подписок, сообщаются
+    только в alert_chat_id, остальные ошибки — в чат подписки.
+    Если заданы commands, движок отвечает на команды чатов, а
+    подписки, приостановленные командой /pause, не опрашиваются.
+    Подписки можно добавлять и снимать на ходу: add_tenant(),
+    remove_tenant(). С хранилищем аренд leases движок опрашивает только
+    подписки, аренды которых держит этот узел.
+    """
+
+    def __init__(self, bot, tenants, pipeline, period,
+                 concurrency=POLL_CONCURRENCY, storage=None,
+                 alert_chat_id=None, commands=None,
+                 shutdown_timeout=SHUTDOWN_TIMEOUT, outbox=None,
+                 leases=None):
+        """Готовит движок; опрос начинается в run()."""
+        self.outbox = (outbox if outbox is not None
+                       else Outbox(bot, on_sent=self._delivered))
+        self.digests = DigestBuffer(self.outbox, pipeline.digest)
+        self.tenants = list(tenants)
+        self.catalog = self.tenants
+        self.leases = leases
+        if leases is not None:
+            self.tenants = []
+        self._positions = {
+            tenant.key: index for index, tenant in enumerate(self.tenants)}
+        self.pipeline = pipeline
+        self.period = period
+        self.policy = PollPolicy(period)
+        self.storage = storage
+        self.breaker = CircuitBreaker()
+        self.alert_chat_id = alert_chat_id
+        self.alerts = AlertSuppressor()
+        self.commands = commands
+        self.shutdown_timeout = shutdown_timeout
+        self.concurrency = concurrency
+        self._executor = ThreadPoolExecutor(
+            max_workers=concurrency, thread_name_prefix='poll')
+        self._semaphore = None
+        self._stopping = None
+        self._tasks = None
+        self._scheduled = None
+        self.wheel = None
+        self.flights = SingleFlight()
+        self.running = False
+        self.in_flight = 0
+
+    def phase(self, tenant):
+        """Смещение первого опроса, чтобы подписки не стартовали разом.
+
+        Смещение зависит от токена: чаты, следящие за одним студентом,
+        опрашиваются одновременно и делят один запрос к API.
+        """
+        token = tenant.headers.get('Authorization', '')
+        return zlib.crc32(token.encode()) % (self.period * 1000) / 1000
+
+    async def run(self, handle_signals=False):
+        """Запускает опрос всех подписок и работает до stop() или отмены.
+
+        С handle_signals останавливается по SIGTERM и SIGINT.
+        """
+        loop = asyncio.get_running_loop()
+        self._semaphore = asyncio.Semaphore(self.concurrency)
+        self._stopping = asyncio.Event()
+        if handle_signals:
+            for signum in SHUTDOWN_SIGNALS:
+                loop.add_signal_handler(signum, self.stop)
+        self.outbox.start()
+        self._register_metrics()
+        listener = None
+        if self.commands is not None:
+            listener = CommandListener(
+                self.outbox.bot, self.commands, self.outbox.put_threadsafe)
+            listener.start()
+        background = []
+        if self.storage is not None:
+            restored = await self._call(self._restore)
+            logger.info(f'Восстановлено состояние {restored} подписок')
+            background.append(
+                asyncio.ensure_future(self._flush_periodically()))
+        self._tasks = {}
+        self._scheduled = {}
+        self.wheel = TimingWheel(now=loop.time())
+        for tenant in self.tenants:
+            self._start_tenant(tenant)
+        background.append(asyncio.ensure_future(self._drive()))
+        if self.leases is not None:
+            coordinator = LeaseCoordinator(self.leases, self, self.catalog)
+            background.append(asyncio.ensure_future(coordinator.run()))
+        self.running = True
+        try:
+            await self._stopping.wait()
+        finally:
+            self.running = False
+            tasks = list(self._tasks.values()) + background
+            for task in tasks:
+                task.cancel()
+            self.flights.cancel_all()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            if listener is not None:
+                listener.stop()
+            await self._shutdown()
+
+    def stop(self):
+        """Просит движок остановиться; вызывается из цикла событий."""
+        if self._stopping is not None and not self._stopping.is_set():
+            logger.info('Остановка: отправка очереди и сохранение состояния')
+            self._stopping.set()
+
+    async def _shutdown(self):
+        """Отправляет накопленное и сохраняет состояние за shutdown_timeout.
+
+        Сводки отправляются, не дожидаясь окна DIGEST_WINDOW. Начатые
+        опросы к этому моменту отменены до разбора ответа, поэтому
+        курсор и статусы не сдвинуты и опрос повторится после запуска.
+        """
+        self.digests.flush_all()
+        if not await self.outbox.drain(timeout=self.shutdown_timeout):
+            logger.warning(f'За {self.shutdown_timeout} с не отправлено '
+                           f'{self.outbox.depth} сообщений')
+        if self.storage is not None:
+            await self._call(self.storage.flush)
+        if self.leases is not None:
+            try:
+                await self._call(self.leases.release_all)
+            except sqlite3.Error as error:
+                logger.error(f'Аренды не освобождены: {error}')
+        await self.outbox.stop()
+        self._executor.shutdown(wait=False)
+
+    def _start_tenant(self, tenant):
+        for homework in tenant.homeworks.take_unsent():
+            self._notify(tenant, homework)
+        loop = asyncio.get_running_loop()
+        self._schedule(tenant, loop.time() + self.phase(tenant))
+
+    def _schedule(self, tenant, deadline):
+        self._scheduled[tenant.key] = (tenant, deadline)
+        self.wheel.schedule(tenant.key, deadline)
+
+    async def _drive(self):
+        """Запускает опросы, срок которых наступил, раз в тик колеса."""
+        loop = asyncio.get_running_loop()
+        while True:
+            now = loop.time()
+            for key, _ in self.wheel.advance(now):
+                tenant, deadline = self._scheduled.pop(key)
+                metrics.SCHEDULE_DRIFT.observe(max(0, now - deadline))
+                task = asyncio.ensure_future(self._run_due(tenant, deadline))
+                task.add_done_callback(self._tenant_done)
+                self._tasks[key] = task
+            await asyncio.sleep(self.wheel.tick)
+
+    async def _run_due(self, tenant, deadline):
+        """Опрашивает подписку и ставит следующий опрос в колесо."""
+        if not tenant.paused:
+            await self.poll(tenant)
+        del self._tasks[tenant.key]
+        self._schedule(
+            tenant, deadline + self.policy.interval(tenant, len(self.catalog)))
+
+    def _tenant_done(self, task):
+        if not task.cancelled() and task.exception() is not None:
+            logger.error('Опрос подписки остановлен из-за ошибки',
+                         exc_info=task.exception())
+
+    def add_tenant(self, tenant):
+        """Добавляет подписку; в работающем движке её опрос начинается сразу.
+
+        Состояние подписки берётся как есть: восстановить его из
+        хранилища — забота вызывающего.
+        """
+        self._positions[tenant.key] = len(self.tenants)
+        self.tenants.append(tenant)
+        if self._tasks is not None:
+            self._start_tenant(tenant)
+
+    def remove_tenant(self, key):
+        """Снимает подписку с опроса и возвращает её или None.
+
+        Начатый опрос отменяется до разбора ответа, так что состояние
+        подписки остаётся согласованным и его можно передать дальше.
+        Подписка ищется по ключу, а на её место в списке встаёт
+        последняя, поэтому снятие не зависит от числа подписок.
+        """
+        index = self._positions.pop(key, None)
+        if index is None:
+            return None
+        tenant = self.tenants[index]
+        last = self.tenants.pop()
+        if last is not tenant:
+            self.tenants[index] = last
+            self._positions[last.key] = index
+        if self._tasks is not None:
+            self.wheel.cancel(key)
+            self._scheduled.pop(key, None)
+            task = self._tasks.pop(key, None)
+            if task is not None:
+                task.cancel()
+        self.digests.flush(tenant.chat_id)
+        if self.storage is not None:
+            self.storage.stage(tenant)
+        return tenant
+
+    def _register_metrics(self):
+        metrics.track_tenants(self.tenants)
+        metrics.REGISTRY.gauge(
+            'homework_outbox_depth', 'Сообщения в очереди на отправку',
+            callback=lambda: self.outbox.depth)
+        metrics.REGISTRY.gauge(
+            'homework_digest_pending', 'Изменения, ждущие отправки в сводке',
+            callback=lambda: len(self.digests))
+        metrics.REGISTRY.gauge(
+            'homework_polls_in_flight', 'Опросы, выполняемые сейчас',
+            callback=lambda: self.in_flight)
+        metrics.REGISTRY.gauge(
+            'homework_breaker_open', 'Предохранитель API разомкнут',
+            callback=lambda: int(self.breaker.state != self.breaker.CLOSED))
+
+    def _restore(self):
+        return sum(self.storage.restore(tenant) for tenant in self.tenants)
+
+    async def _flush_periodically(self):
+        while True:
+            await asyncio.sleep(STATE_FLUSH_INTERVAL)
+            await self._call(self.storage.flush)
+
+    async def _call(self, func, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, func, *args)
+
+    def _process(self, tenant, result):
+        api_answer = result.answer()
+        homeworks = result.checked(self.pipeline.check)
+        changes = tenant.homeworks.diff(homeworks or [])
+        for homework in changes:
+            tenant.homeworks.remember(homework)
+            if self.storage is not None:
+                self.storage.stage_unsent(tenant.key, homework)
+            self._notify(tenant, homework)
+        if not changes:
+            logger.debug(f'{tenant}: нет новых статусов')
+        tenant.record_poll(changes)
+        tenant.timestamp = next_timestamp(api_answer, tenant.timestamp)
+
+    def _notify(self, tenant, homework):
+        """Добавляет изменение в сводку чата подписки.
+
+        Статус запоминается сразу, чтобы следующий опрос не сообщил о нём
+        снова, а уведомление хранится в хранилище, пока Telegram не примет
+        сводку: процесс, упавший или остановленный до отправки, отправит
+        его после перезапуска.
+        """
+        receipt = None
+        if self.storage is not None:
+            receipt = (tenant.key, homework)
+        self.digests.add(tenant.chat_id, homework, receipt)
+
+    def _delivered(self, receipts):
+        if self.storage is not None:
+            self.storage.stage_sent(receipts)
+
+    def _alert(self, tenant, error):
+        if is_transient(error):
+            if self.alert_chat_id is None:
+                return
+            chat_id, alerts = self.alert_chat_id, self.alerts
+        else:
+            if tenant.alerts is None:
+                tenant.alerts = AlertSuppressor()
+            chat_id, alerts = tenant.chat_id, tenant.alerts
+        message = alerts.check(error)
+        if message is not None:
+            self.outbox.put(chat_id, message)
+
+    async def _defer(self, headers):
+        """Откладывает запрос, пока он не уложится в лимиты запросов."""
+        if self.pipeline.delay is None:
+            return
+        while True:
+            delay = self.pipeline.delay(headers)
+            if not delay:
+                return
+            metrics.BUDGET_DEFERRALS.inc()
+            await asyncio.sleep(delay)
+
+    async def _fetch(self, headers, timestamp):
+        """Запрос к API с учётом лимитов, предохранителя и повторов."""
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+        await self._defer(headers)
+        async with self._semaphore:
+            self.in_flight += 1
+            try:
+                response = await call_with_retries(
+                    lambda: self._call(
+                        self.pipeline.fetch, headers, timestamp),
+                    self.breaker,
+                )
+            finally:
+                self.in_flight -= 1
+        return FetchResult(response)
+
+    async def poll(self, tenant):
+        """Один цикл опроса подписки: запрос, проверка, уведомление.
+
+        Подписки с одним токеном и курсором, опрашиваемые одновременно,
+        делят один запрос к API и один разобранный ответ.
+        """
+        headers, timestamp = tenant.headers, tenant.timestamp
+        key = (headers.get('Authorization'), timestamp)
+        if key in self.flights:
+            metrics.COALESCED_POLLS.inc()
+        try:
+            result = await self.flights.do(
+                key, lambda: self._fetch(headers, timestamp))
+            if result.digest == tenant.fingerprint:
+                logger.debug(f'{tenant}: ответ не изменился')
+                tenant.record_poll(())
+                if result.current_date is not None:
+                    tenant.timestamp = max(
+                        tenant.timestamp, result.current_date)
+            else:
+                self._process(tenant, result)
+                tenant.fingerprint = result.digest
+        except BudgetExceeded as error:
+            logger.warning(f'{tenant}: опрос пропущен: {error}')
+        except Exception as error:
+            logger.exception(f'{tenant}: Сбой в работе программы: {error}')
+            self._alert(tenant, error)
+        if self.storage is not None:
+            self.storage.stage(tenant)
+
+
+def run(bot, tenants, pipeline, period, storage=None, alert_chat_id=None,
+        commands=None, leases=None):
+    """Запускает движок в новом цикле событий."""
+    engine = PollingEngine(bot, tenants, pipeline, period, storage=storage,
+                           alert_chat_id=alert_chat_id, commands=commands,
+                           leases=leases)
+    logger.info(f'Запущен опрос {len(engine.catalog)} подписок')
+    asyncio.run(engine.run(handle_signals=True))
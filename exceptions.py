@@ -1,7 +1,25 @@
 class StatusCodeError(Exception):
     """ Неверный код статуса """
-    pass
+
+    def __init__(self, message, status_code=None):
+        super().__init__(message)
+        self.status_code = status_code
 
 class ApiNotFoundError(Exception):
     """ Нет доступа к API """
     pass
+
+class CircuitOpenError(ApiNotFoundError):
+    """ Запросы к API приостановлены после серии сбоев """
+    pass
+
+class ShutdownRequested(Exception):
+    """ Получен сигнал остановки процесса """
+    pass
+
+class BudgetExceeded(Exception):
+    """ Запрос не укладывается в лимит запросов к API """
+
+    def __init__(self, message, retry_after=0):
+        super().__init__(message)
+        self.retry_after = retry_after
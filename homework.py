@@ -4,19 +4,16 @@ import sys
 import time
 from http import HTTPStatus
 
-import requests
-import telegram
-from dotenv import load_dotenv
-from telegram.error import BadRequest
-
-from exceptions import StatusCodeError, ApiNotFoundError
-
-load_dotenv()
-
+import metrics
+from exceptions import (ApiNotFoundError, BudgetExceeded, ShutdownRequested,
+                        StatusCodeError)
+from state import Homework, TenantState, next_timestamp
 
 PRACTICUM_TOKEN = os.getenv('PRACTICUM_TOKEN')
 TELEGRAM_TOKEN = os.getenv('TELEGRAM_TOKEN')
 TELEGRAM_CHAT_ID = os.getenv('TELEGRAM_CHAT_ID')
+TENANTS_FILE = os.getenv('TENANTS_FILE')
+STATE_DB = os.getenv('STATE_DB')
 
 RETRY_PERIOD = 60 * 10
 ENDPOINT = 'https://practicum.yandex.ru/api/user_api/homework_statuses/'
@@ -31,6 +28,27 @@ HOMEWORK_VERDICTS = {
 logger = logging.getLogger(__name__)
 
 
+def load_config(env_file=None):
+    """Загружает настройки из файла .env и окружения.
+
+    Вызывается при запуске бота, а не при импорте модуля: импорт
+    homework не читает файлов и не меняет os.environ. Модули
+    со своими настройками импортируются после этого вызова и тоже
+    видят значения из .env.
+    """
+    from dotenv import load_dotenv
+
+    global PRACTICUM_TOKEN, TELEGRAM_TOKEN, TELEGRAM_CHAT_ID
+    global TENANTS_FILE, STATE_DB, HEADERS
+    load_dotenv(env_file)
+    PRACTICUM_TOKEN = os.getenv('PRACTICUM_TOKEN')
+    TELEGRAM_TOKEN = os.getenv('TELEGRAM_TOKEN')
+    TELEGRAM_CHAT_ID = os.getenv('TELEGRAM_CHAT_ID')
+    TENANTS_FILE = os.getenv('TENANTS_FILE')
+    STATE_DB = os.getenv('STATE_DB')
+    HEADERS = {'Authorization': f'OAuth {PRACTICUM_TOKEN}'}
+
+
 def check_tokens():
     """Проверяет доступность переменных окружения.
 
@@ -55,12 +73,22 @@ def check_tokens():
 
 def send_message(bot, message):
     """Отправляет сообщение в Telegram чат."""
+    send_to_chat(bot, TELEGRAM_CHAT_ID, message)
+
+
+def send_to_chat(bot, chat_id, message):
+    """Отправляет сообщение в указанный Telegram чат."""
+    from telegram.error import BadRequest, TelegramError
+
     try:
-        bot.send_message(TELEGRAM_CHAT_ID, message)
+        bot.send_message(chat_id, message)
+        metrics.MESSAGES.inc(result='sent')
         logger.debug('Сообщение успешно отправлено')
     except BadRequest as error:
+        metrics.MESSAGES.inc(result='failed')
         logger.error(f'Сбой при отправке сообщения: {error}', exc_info=True)
-    except telegram.TelegramError as error:
+    except TelegramError as error:
+        metrics.MESSAGES.inc(result='failed')
         logger.error(
             f'При отправке сообщения в телеграмм произошла ошибка: {error}',
             exc_info=True
@@ -69,20 +97,50 @@ def send_message(bot, message):
 
 def get_api_answer(timestamp):
     """Делает запрос к API сервису Яндекс.Практикума."""
+    return request_api(HEADERS, timestamp).json()
+
+
+@metrics.POLL_LATENCY.time()
+def request_api(headers, timestamp):
+    """Запрашивает API с заголовками подписки и возвращает сырой ответ."""
+    import requests
+
+    import http_client
+    import journal
+
     payload = {'from_date': timestamp}
     try:
-        response = requests.get(ENDPOINT, headers=HEADERS, params=payload)
+        response = http_client.get_client().get(
+            ENDPOINT, headers=headers, params=payload)
     except requests.RequestException as ex:
+        metrics.API_ERRORS.inc(type=ApiNotFoundError.__name__)
         raise ApiNotFoundError(
             f'Нет доступа к API яндекса: {ENDPOINT}') from ex
     else:
+        journal.record(headers, timestamp, response)
         if not response.status_code == HTTPStatus.OK:
-            raise StatusCodeError('Статус кода не 200')
-        return response.json()
+            metrics.API_ERRORS.inc(type=StatusCodeError.__name__)
+            raise StatusCodeError(
+                f'Статус кода не 200: {response.status_code}',
+                response.status_code,
+            )
+        return response
+
+
+def request_delay(headers):
+    """Секунды, на которые нужно отложить запрос из-за лимитов API."""
+    import http_client
 
+    return http_client.get_client().delay(headers)
 
+
+@metrics.count_errors(metrics.VALIDATION_FAILURES, (KeyError, TypeError))
 def check_response(response):
-    """Проверяет корректность данных, запрошенных от API Практикум.Домашка."""
+    """Проверяет корректность данных, запрошенных от API Практикум.Домашка.
+
+    Ошибка в структуре ответа бросает исключение, а некорректная работа
+    только пропускается: остальные работы ответа не теряются.
+    """
     if not response:
         raise KeyError(
             'Функция не получила JSON'
@@ -96,77 +154,271 @@ def check_response(response):
             f'при получении ответа от api {response}'
             'в словаре нет домашней работы или она не является листом '
         )
-    if not response.get('homeworks'):
+    homeworks = response['homeworks']
+    if not homeworks:
         logger.info(f'в {response}  пустой JSON')
-        return False
-    status = response.get('homeworks')[0]['status']
+        return []
+    records = []
+    for index, homework in enumerate(homeworks):
+        try:
+            records.append(homework_record(homework))
+        except (KeyError, TypeError) as error:
+            metrics.VALIDATION_FAILURES.inc()
+            logger.error(f'homeworks[{index}] пропущена: {error.args[0]}')
+    return records
+
+
+def homework_record(homework):
+    """Проверяет одну работу из ответа API и возвращает её запись."""
+    if not isinstance(homework, dict):
+        raise TypeError(f'работа {homework} пришла не словарём')
+    if 'status' not in homework:
+        raise KeyError('Ошибка доступа по ключу status')
+    status = sys.intern(str(homework['status']))
     if status not in HOMEWORK_VERDICTS:
-        raise KeyError(
-            f'Статус {status} от API отсутствует либо неверный'
-        )
-    return response['homeworks']
+        raise KeyError(f'Статус {status} от API отсутствует либо неверный')
+    if 'homework_name' not in homework:
+        raise KeyError('homework_name нет в домашней работе')
+    name = homework['homework_name']
+    return Homework(str(homework.get('id', name)), name, status)
 
 
 def parse_status(homework):
     """Извлекает о конкретной домашней работе статус этой работы."""
-    if 'status' not in homework:
-        raise KeyError('Ошибка доступа по ключу homework_name')
-    elif homework['status'] not in HOMEWORK_VERDICTS:
-        raise KeyError('status неизвестен боту')
-    elif 'homework_name' not in homework:
-        raise KeyError('homework_name нет в домашней работе')
-    verdict = homework['status']
-    homework_name = homework['homework_name']
-    message = HOMEWORK_VERDICTS[verdict]
+    if not isinstance(homework, Homework):
+        homework = homework_record(homework)
+    message = HOMEWORK_VERDICTS[homework.status]
 
     return (
         'Изменился статус проверки работы "'
-        f'{homework_name}"'
-        f'{verdict}'
+        f'{homework.name}"'
+        f'{homework.status}'
         f'{message}'
     )
 
 
+def format_digest(homeworks):
+    """Собирает изменения нескольких работ в одно сообщение."""
+    if len(homeworks) == 1:
+        return parse_status(homeworks[0])
+    lines = [
+        f'"{homework.name}": {HOMEWORK_VERDICTS[homework.status]}'
+        for homework in homeworks
+    ]
+    return 'Изменились статусы проверки работ:\n' + '\n'.join(lines)
+
+
+def open_storage():
+    """Открывает хранилище состояния, если задан STATE_DB."""
+    if not STATE_DB:
+        return None
+    from storage import StateStorage
+
+    return StateStorage(STATE_DB)
+
+
+def open_lease(tenant, storage):
+    """Аренда подписки для работы в резерве, если задан LEASE_DB.
+
+    Узел, захвативший аренду, перечитывает состояние из STATE_DB,
+    поэтому оно должно быть общим у всех узлов.
+    """
+    from leases import TenantLease, open_store
+
+    store = open_store()
+    if store is None:
+        return None
+    if storage is None:
+        logger.warning('LEASE_DB без STATE_DB: новый владелец подписки '
+                       'повторит уже отправленные уведомления')
+        return TenantLease(store, tenant.key)
+    return TenantLease(store, tenant.key, lambda: storage.restore(tenant))
+
+
+def start_metrics():
+    """Запускает сервер метрик, если задан METRICS_PORT."""
+    port = int(os.getenv('METRICS_PORT', 0))
+    if port:
+        metrics.start_http_server(port)
+
+
+def start_commands(tenants, storage=None):
+    """Запускает ответы на команды чатов, если задан BOT_COMMANDS.
+
+    У слушателя свой экземпляр бота: долгий getUpdates не занимает
+    соединение, через которое уходят уведомления. С LEASE_DB команды
+    не запускаются: узел в резерве ответил бы по чужому состоянию.
+    """
+    import telegram
+    from commands import BOT_COMMANDS, CommandListener, Commands
+    from leases import LEASE_DB
+
+    if not BOT_COMMANDS:
+        return None
+    if LEASE_DB:
+        logger.warning('Команды чатов не поддерживаются с LEASE_DB')
+        return None
+    bot = telegram.Bot(token=TELEGRAM_TOKEN)
+    return CommandListener(
+        bot,
+        Commands(tenants, HOMEWORK_VERDICTS, storage=storage),
+        lambda chat_id, text: send_to_chat(bot, chat_id, text),
+    ).start()
+
+
+def poll_tenant(bot, tenant):
+    """Один опрос API: уведомляет об изменениях и сдвигает курсор."""
+    api_answer = get_api_answer(tenant.timestamp)
+    response = check_response(api_answer)
+    changes = tenant.homeworks.diff(response or [])
+    if changes:
+        send_message(bot, format_digest(changes))
+        for homework in changes:
+            tenant.homeworks.remember(homework)
+    elif not api_answer['homeworks']:
+        logger.info('Нет изменений домашних работ с прошлого запроса')
+    else:
+        logger.debug('нет новых статусов')
+    tenant.record_poll(changes)
+    tenant.timestamp = next_timestamp(api_answer, tenant.timestamp)
+
+
+def poll_cycle(bot, tenant, alerts, lease=None):
+    """Опрос с обработкой сбоев.
+
+    Подписка на паузе не опрашивается, как и подписка, аренду которой
+    держит другой узел.
+    """
+    if tenant.paused:
+        logger.debug('Опрос приостановлен командой /pause')
+        return
+    if lease is not None and not lease.hold():
+        logger.debug('Подписку опрашивает другой узел')
+        return
+    try:
+        poll_tenant(bot, tenant)
+    except BudgetExceeded as error:
+        logger.warning(f'Опрос пропущен: {error}')
+    except Exception as error:
+        logger.exception(f'Сбой в работе программы: {error}')
+        message = alerts.check(error)
+        if message is not None:
+            bot.send_message(TELEGRAM_CHAT_ID, message)
+
+
 def main():
     """Основная логика работы бота."""
     if not check_tokens():
         message = 'Ошибка доступности переменных окружения'
         sys.exit([message])
+    import telegram
+    from alerts import AlertSuppressor
+    from scheduler import PollPolicy
+    from shutdown import GracefulExit
+
     bot = telegram.Bot(token=TELEGRAM_TOKEN)
-    timestamp = int(time.time())
-    old_message = None
-    old_response = None
-    while True:
+    tenant = TenantState(PRACTICUM_TOKEN, TELEGRAM_CHAT_ID)
+    storage = open_storage()
+    if storage is not None:
+        storage.restore(tenant)
+    lease = open_lease(tenant, storage)
+    policy = PollPolicy(RETRY_PERIOD)
+    alerts = AlertSuppressor()
+    metrics.track_tenants([tenant])
+    start_metrics()
+    listener = start_commands([tenant], storage)
+    with GracefulExit() as shutdown:
         try:
-            if type(timestamp) is not int:
-                raise SystemError('В функцию передана не дата')
-            api_answer = get_api_answer(timestamp)
-            response = check_response(api_answer)
-            if not api_answer['homeworks']:
-                logger.info('Нет домашней работы с запуска бота')
-                continue
-            if response != old_response:
-                homework_status = parse_status(response[0])
-                if homework_status is not None:
-                    send_message(bot, homework_status)
-                    old_response = response
-            else:
-                logger.debug('нет новых статусов')
-        except Exception as error:
-            message = f'Сбой в работе программы: {error}'
-            logger.exception(message)
-            if message != old_message:
-                bot.send_message(TELEGRAM_CHAT_ID, message)
-                old_message = message
-        finally:
-            time.sleep(RETRY_PERIOD)
+            while True:
+                try:
+                    poll_cycle(bot, tenant, alerts, lease)
+                finally:
+                    interval = policy.interval(tenant)
+                    if lease is None or lease.extend(interval):
+                        if storage is not None:
+                            storage.save(tenant)
+                    with shutdown.interruptible():
+                        time.sleep(interval)
+        except ShutdownRequested:
+            logger.info('Бот остановлен, состояние сохранено')
+    if listener is not None:
+        listener.stop()
+    if storage is not None:
+        storage.close()
+    if lease is not None:
+        lease.release()
 
 
-if __name__ == '__main__':
-    logging.basicConfig(
-        level=logging.INFO,
-        filename='main.log',
-        format='%(asctime)s, %(levelname)s, %(name)s, %(message)s'
+def serve():
+    """Опрашивает все подписки из файла TENANTS_FILE.
+
+    С SHARD_WORKERS больше 1 (или auto) подписки делятся между
+    процессами-воркерами, иначе опрашиваются в одном процессе.
+    """
+    if not TELEGRAM_TOKEN:
+        logger.critical('Отсутствует обязательная переменная окружения: '
+                        'TELEGRAM_TOKEN Программа принудительно остановлена.')
+        sys.exit(['Ошибка доступности переменных окружения'])
+    import telegram
+    from telegram.utils.request import Request
+
+    import engine
+    import leases
+    import sharding
+    from commands import BOT_COMMANDS, Commands
+    from outbox import OUTBOX_WORKERS
+
+    bot = telegram.Bot(
+        token=TELEGRAM_TOKEN,
+        request=Request(con_pool_size=OUTBOX_WORKERS + 4),
+    )
+    start_metrics()
+    tenants = engine.load_tenants(TENANTS_FILE)
+    pipeline = engine.Pipeline(
+        fetch=request_api,
+        check=check_response,
+        digest=format_digest,
+        delay=request_delay,
+    )
+    alert_chat_id = os.getenv('ALERT_CHAT_ID', TELEGRAM_CHAT_ID)
+    workers = sharding.worker_count()
+    if workers > 1 and leases.LEASE_DB:
+        logger.critical('LEASE_DB нельзя совмещать с SHARD_WORKERS')
+        sys.exit(['Ошибка настройки: LEASE_DB и SHARD_WORKERS'])
+    if leases.LEASE_DB and not STATE_DB:
+        logger.critical('LEASE_DB требует общего STATE_DB: иначе новый '
+                        'владелец подписки повторит уже отправленные '
+                        'уведомления')
+        sys.exit(['Ошибка настройки: LEASE_DB без STATE_DB'])
+    commands = BOT_COMMANDS
+    if commands and (workers > 1 or leases.LEASE_DB):
+        logger.warning('Команды чатов не поддерживаются с SHARD_WORKERS '
+                       'и LEASE_DB: подписки чата опрашивает не этот процесс')
+        commands = False
+    if workers > 1:
+        sharding.run(bot, tenants, pipeline, RETRY_PERIOD, workers=workers,
+                     storage_path=STATE_DB, alert_chat_id=alert_chat_id)
+        return
+    storage = open_storage()
+    engine.run(
+        bot,
+        tenants,
+        pipeline,
+        RETRY_PERIOD,
+        storage=storage,
+        alert_chat_id=alert_chat_id,
+        commands=(Commands(tenants, HOMEWORK_VERDICTS, storage=storage)
+                  if commands else None),
+        leases=leases.open_store(),
     )
 
-    main()
+
+if __name__ == '__main__':
+    load_config()
+    from log_config import setup_logging
+
+    setup_logging()
+    if TENANTS_FILE:
+        serve()
+    else:
+        main()
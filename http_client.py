@@ -0,0 +1,91 @@
+"""Общий HTTP-клиент с пулом соединений для запросов к API Практикума."""
+import os
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from exceptions import BudgetExceeded
+from ratelimit import RequestBudget
+
+HTTP_CONNECT_TIMEOUT = float(os.getenv('HTTP_CONNECT_TIMEOUT', 3.05))
+HTTP_READ_TIMEOUT = float(os.getenv('HTTP_READ_TIMEOUT', 10))
+HTTP_POOL_CONNECTIONS = int(os.getenv('HTTP_POOL_CONNECTIONS', 4))
+HTTP_POOL_MAXSIZE = int(os.getenv('HTTP_POOL_MAXSIZE', 64))
+API_TOKEN_RATE = float(os.getenv('API_TOKEN_RATE', 0))
+API_TOKEN_BURST = float(os.getenv('API_TOKEN_BURST', 3))
+API_GLOBAL_RATE = float(os.getenv('API_GLOBAL_RATE', 0))
+API_GLOBAL_BURST = float(os.getenv('API_GLOBAL_BURST', 10))
+
+_client = None
+_client_lock = threading.Lock()
+
+
+class HttpClient:
+    """Сессия requests с keep-alive, пулом соединений и таймаутами.
+
+    Повторы на уровне urllib3 отключены: решение о повторе
+    принимает вызывающий код. Если задан budget, запросы сверх лимита
+    для токена из заголовка Authorization или сверх общего лимита
+    не отправляются: get() бросает BudgetExceeded.
+    """
+
+    def __init__(self, connect_timeout=HTTP_CONNECT_TIMEOUT,
+                 read_timeout=HTTP_READ_TIMEOUT,
+                 pool_connections=HTTP_POOL_CONNECTIONS,
+                 pool_maxsize=HTTP_POOL_MAXSIZE, budget=None):
+        """Открывает сессию с пулом соединений и таймаутами по умолчанию."""
+        self.timeout = (connect_timeout, read_timeout)
+        self.budget = budget
+        self.session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=pool_connections,
+            pool_maxsize=pool_maxsize,
+            max_retries=0,
+        )
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+    def get(self, url, **kwargs):
+        """GET-запрос через общий пул соединений."""
+        kwargs.setdefault('timeout', self.timeout)
+        if self.budget is not None:
+            wait = self.budget.acquire(token(kwargs.get('headers')))
+            if wait:
+                raise BudgetExceeded(
+                    f'Лимит запросов к API исчерпан, ждать {wait:.1f} с',
+                    retry_after=wait)
+        return self.session.get(url, **kwargs)
+
+    def delay(self, headers):
+        """Секунды, на которые стоит отложить запрос с такими заголовками."""
+        if self.budget is None:
+            return 0
+        return self.budget.delay(token(headers))
+
+    def close(self):
+        """Закрывает все соединения пула."""
+        self.session.close()
+
+
+def token(headers):
+    """Токен запроса, по которому ведётся его лимит."""
+    return (headers or {}).get('Authorization')
+
+
+def default_budget():
+    """Лимиты запросов из окружения или None, если они не заданы."""
+    if not (API_TOKEN_RATE or API_GLOBAL_RATE):
+        return None
+    return RequestBudget(API_TOKEN_RATE, API_GLOBAL_RATE,
+                         API_TOKEN_BURST, API_GLOBAL_BURST)
+
+
+def get_client():
+    """Возвращает общий для процесса клиент, создавая его при первом вызове."""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = HttpClient(budget=default_budget())
+    return _client
@@ -0,0 +1,235 @@
+"""Журнал сырых ответов API Практикума и его воспроизведение.
+
+Если задан JOURNAL_FILE, каждый ответ API (подписка, время, код ответа,
+тело) дописывается в сжатый gzip-файл. Запрос только кладёт ответ
+в очередь, сериализацию и запись выполняет фоновый поток. Если запись
+не успевает, ответы сверх JOURNAL_QUEUE_SIZE пропускаются.
+
+Записанный журнал можно прогнать через проверку ответа и сборку
+уведомлений без обращения к API:
+
+    python journal.py journal.jsonl.gz
+
+У каждого процесса-воркера свой файл JOURNAL_FILE.worker-N: два
+процесса, дописывающие gzip-потоки в один файл, перемешали бы их.
+Файлы воркеров воспроизводятся вместе, записи идут по времени:
+
+    python journal.py journal.jsonl.gz.worker-*
+"""
+import atexit
+import gzip
+import hashlib
+import heapq
+import json
+import logging
+import os
+import queue
+import sys
+import threading
+import time
+from collections import Counter, namedtuple
+from http import HTTPStatus
+from operator import attrgetter
+
+import metrics
+from state import HomeworkStates
+
+JOURNAL_FILE = os.getenv('JOURNAL_FILE')
+JOURNAL_QUEUE_SIZE = int(os.getenv('JOURNAL_QUEUE_SIZE', 10000))
+
+JournalRecord = namedtuple(
+    'JournalRecord', ('time', 'tenant', 'from_date', 'status', 'body'))
+JournalRecord.__doc__ = """Запись журнала: один ответ API.
+
+tenant — хэш заголовка Authorization, сам токен в журнал не попадает.
+"""
+
+logger = logging.getLogger(__name__)
+
+_journal = None
+_journal_lock = threading.Lock()
+
+
+def tenant_hash(headers):
+    """Идентификатор подписки по заголовкам запроса без раскрытия токена."""
+    token = str(headers.get('Authorization', '')).encode()
+    return hashlib.sha256(token).hexdigest()[:16]
+
+
+def encode_record(record):
+    """Строка журнала с записью в JSON.
+
+    Тело хранится строкой; байты, не являющиеся UTF-8, сохраняются
+    через surrogateescape и восстанавливаются в decode_record.
+    """
+    entry = record._asdict()
+    entry['body'] = record.body.decode('utf-8', 'surrogateescape')
+    return json.dumps(entry).encode() + b'\n'
+
+
+def decode_record(line):
+    """Запись журнала из строки, записанной encode_record."""
+    entry = json.loads(line)
+    entry['body'] = entry['body'].encode('utf-8', 'surrogateescape')
+    return JournalRecord(**entry)
+
+
+class Journal:
+    """Дописывает ответы API в gzip-файл из фонового потока.
+
+    Каждое открытие добавляет к файлу новый gzip-поток, поэтому журнал
+    только растёт и читается целиком обычным gzip. Файл открывается
+    сразу, и ошибка открытия достаётся вызывающему. Сжатый буфер
+    сбрасывается на диск, когда очередь опустела; если в очереди уже
+    queue_size записей, новые пропускаются, а не копятся в памяти.
+    """
+
+    def __init__(self, path, queue_size=JOURNAL_QUEUE_SIZE):
+        """Открывает файл журнала и запускает поток записи."""
+        self.path = path
+        self.dropped = 0
+        self._file = gzip.open(path, 'ab')
+        self._queue = queue.Queue(queue_size)
+        self._thread = threading.Thread(
+            target=self._write, name='journal', daemon=True)
+        self._thread.start()
+
+    def record(self, headers, from_date, status_code, body):
+        """Ставит ответ в очередь на запись или пропускает его."""
+        try:
+            self._queue.put_nowait(JournalRecord(
+                time.time(), tenant_hash(headers), from_date, status_code,
+                body))
+        except queue.Full:
+            if not self.dropped:
+                logger.warning('Очередь журнала переполнена, ответы '
+                               'пропускаются')
+            self.dropped += 1
+            metrics.JOURNAL_DROPS.inc()
+
+    def _write(self):
+        with self._file as file:
+            while True:
+                record = self._queue.get()
+                if record is None:
+                    break
+                try:
+                    file.write(encode_record(record))
+                    if self._queue.empty():
+                        file.flush()
+                except (OSError, ValueError) as error:
+                    logger.error(f'Сбой записи журнала: {error}')
+
+    def close(self):
+        """Дописывает очередь и закрывает файл."""
+        if self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join()
+
+
+def get_journal():
+    """Журнал процесса или None, если JOURNAL_FILE не задан или не открылся."""
+    global _journal
+    if _journal is None and JOURNAL_FILE:
+        with _journal_lock:
+            if _journal is None and JOURNAL_FILE:
+                _journal = open_journal(JOURNAL_FILE)
+    return _journal
+
+
+def use_worker_file(node):
+    """Переводит журнал процесса-воркера node в файл JOURNAL_FILE.node."""
+    global JOURNAL_FILE
+    if JOURNAL_FILE:
+        JOURNAL_FILE = f'{JOURNAL_FILE}.{node}'
+
+
+def open_journal(path):
+    """Открывает журнал; если файл не открывается, отключает журнал."""
+    global JOURNAL_FILE
+    try:
+        writer = Journal(path)
+    except OSError as error:
+        logger.error(f'Журнал {path} отключён: {error}')
+        JOURNAL_FILE = None
+        return None
+    atexit.register(writer.close)
+    return writer
+
+
+def record(headers, from_date, response):
+    """Записывает ответ API в журнал, если он включён."""
+    journal = get_journal()
+    if journal is not None:
+        journal.record(headers, from_date, response.status_code,
+                       response.content)
+
+
+def read_journal(path):
+    """Читает записи журнала по порядку.
+
+    Оборванный последний gzip-поток (процесс остановлен во время
+    записи) не считается ошибкой: отдаются все записи до обрыва.
+    """
+    with gzip.open(path, 'rb') as file:
+        try:
+            for line in file:
+                yield decode_record(line)
+        except EOFError:
+            logger.warning(f'Журнал {path} оборван, прочитан до обрыва')
+
+
+def read_journals(paths):
+    """Читает записи нескольких журналов, сливая их по времени."""
+    return heapq.merge(*(read_journal(path) for path in paths),
+                       key=attrgetter('time'))
+
+
+def replay(records, check, digest):
+    """Прогоняет записи журнала через проверку ответа и сборку сводок.
+
+    Для каждой подписки из журнала ведутся свои статусы, как в боте;
+    сообщения собираются, но никуда не отправляются. Возвращает
+    счётчики и скорость прогона.
+    """
+    tenants = {}
+    summary = Counter()
+    started = time.perf_counter()
+    for entry in records:
+        summary['records'] += 1
+        if entry.status != HTTPStatus.OK:
+            summary['status_errors'] += 1
+            continue
+        try:
+            homeworks = check(json.loads(entry.body))
+        except (ValueError, KeyError, TypeError) as error:
+            summary['invalid'] += 1
+            logger.warning(f'{entry.tenant} {entry.time}: {error}')
+            continue
+        states = tenants.setdefault(entry.tenant, HomeworkStates())
+        changes = states.diff(homeworks or [])
+        if changes:
+            digest(changes)
+            summary['messages'] += 1
+            for homework in changes:
+                states.remember(homework)
+    elapsed = time.perf_counter() - started
+    summary['tenants'] = len(tenants)
+    summary['records_per_second'] = round(
+        summary['records'] / elapsed, 1) if elapsed else 0
+    return dict(summary)
+
+
+def main():
+    """Воспроизводит журналы из аргументов командной строки."""
+    if len(sys.argv) < 2:
+        sys.exit('Использование: python journal.py JOURNAL_FILE...')
+    import homework
+
+    summary = replay(read_journals(sys.argv[1:]), homework.check_response,
+                     homework.format_digest)
+    print(json.dumps(summary, ensure_ascii=False))
+
+
+if __name__ == '__main__':
+    main()
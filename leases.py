@@ -0,0 +1,301 @@
+"""Аренда подписок, чтобы несколько узлов не опрашивали одно и то же.
+
+Узлы с одинаковыми настройками делят подписки через общее хранилище
+аренд (LEASE_DB). Подписку опрашивает только узел, держащий её
+аренду. Аренда действует LEASE_TTL секунд и продлевается, пока
+узел жив; аренду упавшего узла по истечении срока забирает другой.
+Каждый узел держит не больше своей доли подписок, поэтому новый узел
+получает часть подписок, а при отказе узла его доля расходится
+по остальным.
+
+Хранилище — SQLite-файл, доступный всем узлам. Сроки аренды
+сравниваются по часам узлов, поэтому часы должны расходиться
+намного меньше LEASE_TTL.
+"""
+import asyncio
+import contextlib
+import hashlib
+import logging
+import math
+import os
+import socket
+import sqlite3
+import threading
+import time
+
+LEASE_DB = os.getenv('LEASE_DB')
+LEASE_TTL = float(os.getenv('LEASE_TTL', 30))
+NODE_ID = os.getenv('NODE_ID') or f'{socket.gethostname()}:{os.getpid()}'
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS leases (
+    tenant_key TEXT PRIMARY KEY,
+    owner TEXT NOT NULL,
+    expires_at REAL NOT NULL
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS nodes (
+    node_id TEXT PRIMARY KEY,
+    seen_at REAL NOT NULL
+) WITHOUT ROWID;
+'''
+
+CLAIM = '''
+INSERT INTO leases (tenant_key, owner, expires_at) VALUES (?, ?, ?)
+ON CONFLICT (tenant_key) DO UPDATE
+SET owner = excluded.owner, expires_at = excluded.expires_at
+WHERE leases.owner = excluded.owner OR leases.expires_at < ?
+'''
+
+logger = logging.getLogger(__name__)
+
+
+class LeaseStore:
+    """Аренды подписок в SQLite, общие для всех узлов.
+
+    Каждая операция — одна транзакция BEGIN IMMEDIATE, поэтому два узла
+    не могут захватить одну подписку одновременно. Узел отмечается
+    в таблице nodes при каждом продлении; живыми считаются узлы,
+    отметившиеся за последние ttl секунд. База в режиме WAL, поэтому
+    узлы должны быть на одном хосте: по сетевой файловой системе WAL
+    не работает.
+    """
+
+    def __init__(self, path, node_id=NODE_ID, ttl=LEASE_TTL,
+                 clock=time.time):
+        """Открывает базу аренд и создаёт таблицы, если их нет."""
+        self.path = path
+        self.node_id = node_id
+        self.ttl = ttl
+        self.clock = clock
+        self.connection = sqlite3.connect(
+            path, check_same_thread=False, isolation_level=None, timeout=10)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.executescript(SCHEMA)
+        self._lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def _transaction(self):
+        with self._lock:
+            self.connection.execute('BEGIN IMMEDIATE')
+            try:
+                yield self.connection
+            except BaseException:
+                self.connection.execute('ROLLBACK')
+                raise
+            self.connection.execute('COMMIT')
+
+    def acquire(self, key, ttl=None):
+        """Захватывает или продлевает аренду одной подписки.
+
+        Возвращает True, если аренда теперь у этого узла.
+        """
+        now = self.clock()
+        with self._transaction() as connection:
+            cursor = connection.execute(
+                CLAIM, (key, self.node_id, now + (ttl or self.ttl), now))
+        return cursor.rowcount > 0
+
+    def claim(self, keys, limit):
+        """Захватывает до limit свободных или просроченных аренд из keys.
+
+        Возвращает список захваченных ключей.
+        """
+        now = self.clock()
+        claimed = []
+        with self._transaction() as connection:
+            for key in keys:
+                if len(claimed) >= limit:
+                    break
+                cursor = connection.execute(
+                    CLAIM, (key, self.node_id, now + self.ttl, now))
+                if cursor.rowcount > 0:
+                    claimed.append(key)
+        return claimed
+
+    def renew(self):
+        """Продлевает аренды узла и отмечает узел живым.
+
+        Возвращает ключи подписок, аренда которых у узла, и число
+        живых узлов. Просроченные аренды не продлеваются: их мог
+        забрать другой узел.
+        """
+        now = self.clock()
+        with self._transaction() as connection:
+            connection.execute(
+                'INSERT OR REPLACE INTO nodes VALUES (?, ?)',
+                (self.node_id, now))
+            connection.execute(
+                'UPDATE leases SET expires_at = ? '
+                'WHERE owner = ? AND expires_at >= ?',
+                (now + self.ttl, self.node_id, now))
+            owned = {key for key, in connection.execute(
+                'SELECT tenant_key FROM leases '
+                'WHERE owner = ? AND expires_at >= ?',
+                (self.node_id, now))}
+            nodes, = connection.execute(
+                'SELECT COUNT(*) FROM nodes WHERE seen_at >= ?',
+                (now - self.ttl,)).fetchone()
+        return owned, nodes
+
+    def release(self, keys):
+        """Отдаёт аренды подписок, чтобы их сразу могли забрать другие."""
+        with self._transaction() as connection:
+            connection.executemany(
+                'DELETE FROM leases WHERE tenant_key = ? AND owner = ?',
+                ((key, self.node_id) for key in keys))
+
+    def release_all(self):
+        """Отдаёт все аренды узла и снимает его отметку живым."""
+        with self._transaction() as connection:
+            connection.execute(
+                'DELETE FROM leases WHERE owner = ?', (self.node_id,))
+            connection.execute(
+                'DELETE FROM nodes WHERE node_id = ?', (self.node_id,))
+
+    def close(self):
+        """Закрывает базу."""
+        self.connection.close()
+
+
+def open_store():
+    """Хранилище аренд, если задан LEASE_DB, иначе None."""
+    if not LEASE_DB:
+        return None
+    return LeaseStore(LEASE_DB)
+
+
+class TenantLease:
+    """Аренда единственной подписки в режиме одного чата.
+
+    Узел без аренды остаётся в резерве и пробует захватить её
+    в каждом цикле. on_acquire вызывается, когда аренда перешла к узлу:
+    в этот момент нужно перечитать состояние, сохранённое прежним
+    владельцем.
+    """
+
+    def __init__(self, store, key, on_acquire=None):
+        """Аренда подписки key в хранилище аренд store."""
+        self.store = store
+        self.key = key
+        self.on_acquire = on_acquire
+        self.held = False
+
+    def hold(self, ttl=None):
+        """Захватывает или продлевает аренду; True, если она у узла."""
+        try:
+            held = self.store.acquire(self.key, ttl)
+        except sqlite3.Error as error:
+            logger.error(f'Сбой хранилища аренд: {error}')
+            held = False
+        if held and not self.held:
+            logger.info(f'Узел {self.store.node_id} опрашивает подписку')
+            if self.on_acquire is not None:
+                self.on_acquire()
+        elif self.held and not held:
+            logger.warning(f'Узел {self.store.node_id} потерял аренду')
+        self.held = held
+        return held
+
+    def extend(self, interval):
+        """Продлевает аренду на время паузы до следующего опроса."""
+        return self.held and self.hold(interval + self.store.ttl)
+
+    def release(self):
+        """Отдаёт аренду при остановке, чтобы резервный узел не ждал срока."""
+        if self.held:
+            self.store.release([self.key])
+            self.held = False
+
+
+def preference(node_id, key):
+    """Порядок, в котором узел пробует захватить подписки.
+
+    У каждого узла свой порядок, поэтому узлы реже спорят
+    за одни и те же свободные подписки.
+    """
+    return hashlib.blake2b(f'{node_id}/{key}'.encode(),
+                           digest_size=8).digest()
+
+
+class LeaseCoordinator:
+    """Держит в движке ровно те подписки, аренды которых у узла.
+
+    Раз в interval секунд (по умолчанию треть срока аренды) продлевает
+    аренды, снимает с опроса потерянные, отдаёт подписки сверх своей
+    доли и захватывает свободные до доли. Подписки, аренда которых
+    уже у узла, но которые движок не опрашивает (узел перезапущен с тем
+    же NODE_ID или снимал подписки при сбое хранилища), снова ставятся
+    на опрос. Захваченная подписка начинает опрос с состояния
+    из хранилища движка; отданная сначала сохраняется, затем
+    освобождается. Если хранилище аренд недоступно, подписки снимаются
+    с опроса до истечения их аренды.
+    """
+
+    def __init__(self, store, engine, catalog, interval=None):
+        """Доля узла считается от числа всех подписок catalog."""
+        self.store = store
+        self.engine = engine
+        self.catalog = {tenant.key: tenant for tenant in catalog}
+        self.interval = interval or store.ttl / 3
+        self.deadline = None
+
+    async def run(self):
+        """Согласует аренды, пока задачу не отменят."""
+        while True:
+            await self.sync()
+            await asyncio.sleep(self.interval)
+
+    async def sync(self):
+        """Один шаг согласования аренд с хранилищем."""
+        started = self.store.clock()
+        try:
+            owned, nodes = await self._call(self.store.renew)
+        except sqlite3.Error as error:
+            logger.error(f'Сбой хранилища аренд: {error}')
+            if self.deadline is not None and started >= self.deadline:
+                self._drop(self.active())
+            return
+        self.deadline = started + self.store.ttl - self.interval
+        self._drop(self.active() - owned)
+        unknown = owned.difference(self.catalog)
+        if unknown:
+            await self._call(self.store.release, unknown)
+            owned -= unknown
+        share = math.ceil(len(self.catalog) / max(nodes, 1))
+        if len(owned) > share:
+            excess = sorted(owned)[share:]
+            self._drop(excess)
+            if self.engine.storage is not None:
+                await self._call(self.engine.storage.flush)
+            await self._call(self.store.release, excess)
+            owned.difference_update(excess)
+        for key in sorted(owned - self.active()):
+            await self._adopt(self.catalog[key])
+        if len(owned) < share:
+            candidates = sorted(
+                (key for key in self.catalog if key not in owned),
+                key=lambda key: preference(self.store.node_id, key))
+            claimed = await self._call(
+                self.store.claim, candidates, share - len(owned))
+            for key in claimed:
+                await self._adopt(self.catalog[key])
+
+    def active(self):
+        """Ключи подписок, которые движок опрашивает сейчас."""
+        return {tenant.key for tenant in self.engine.tenants}
+
+    async def _adopt(self, tenant):
+        if self.engine.storage is not None:
+            await self._call(self.engine.storage.restore, tenant)
+        self.engine.add_tenant(tenant)
+        logger.info(f'{tenant}: аренда получена узлом {self.store.node_id}')
+
+    def _drop(self, keys):
+        for key in keys:
+            tenant = self.engine.remove_tenant(key)
+            if tenant is not None:
+                logger.info(f'{tenant}: аренда передана другому узлу')
+
+    async def _call(self, func, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, func, *args)
@@ -0,0 +1,97 @@
+"""Настройка логирования через очередь и фоновый поток записи."""
+import atexit
+import copy
+import json
+import logging
+import os
+import queue
+from logging.handlers import (
+    QueueHandler, QueueListener, RotatingFileHandler, TimedRotatingFileHandler,
+)
+
+LOG_FILE = os.getenv('LOG_FILE', 'main.log')
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
+LOG_MAX_BYTES = int(os.getenv('LOG_MAX_BYTES', 10 * 1024 * 1024))
+LOG_BACKUP_COUNT = int(os.getenv('LOG_BACKUP_COUNT', 5))
+LOG_ROTATE_WHEN = os.getenv('LOG_ROTATE_WHEN')
+LOG_JSON = os.getenv('LOG_JSON', '').lower() in ('1', 'true', 'yes')
+
+LOG_FORMAT = '%(asctime)s, %(levelname)s, %(name)s, %(message)s'
+
+
+class JsonFormatter(logging.Formatter):
+    """Форматирует запись лога как один JSON-объект в строке."""
+
+    def format(self, record):
+        """Собирает время, уровень, логгер и сообщение в JSON."""
+        entry = {
+            'time': self.formatTime(record),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry['exception'] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False)
+
+
+class RecordQueueHandler(QueueHandler):
+    """Кладёт записи в очередь, не склеивая трассировку с сообщением.
+
+    Стандартный prepare() дописывает трассировку к msg и очищает
+    exc_info, и форматтер в потоке записи уже не видит исключения.
+    Здесь трассировка переводится в текст exc_text, который понимают
+    и обычный форматтер, и JsonFormatter.
+    """
+
+    def prepare(self, record):
+        """Копия записи с готовым сообщением и текстом трассировки."""
+        record = copy.copy(record)
+        record.message = record.getMessage()
+        record.msg = record.message
+        record.args = None
+        if record.exc_info:
+            if not record.exc_text:
+                record.exc_text = logging.Formatter().formatException(
+                    record.exc_info)
+            record.exc_info = None
+        return record
+
+
+def file_handler(filename=LOG_FILE, max_bytes=LOG_MAX_BYTES,
+                 backup_count=LOG_BACKUP_COUNT, when=LOG_ROTATE_WHEN):
+    """Файловый обработчик с ротацией по времени или по размеру."""
+    if when:
+        return TimedRotatingFileHandler(
+            filename, when=when, backupCount=backup_count, encoding='utf-8')
+    return RotatingFileHandler(
+        filename, maxBytes=max_bytes, backupCount=backup_count,
+        encoding='utf-8')
+
+
+def setup_logging(handler=None, level=LOG_LEVEL, json_format=LOG_JSON):
+    """Направляет логи корневого логгера в очередь.
+
+    Вызывающий поток только кладёт запись в очередь, а в файл её
+    пишет фоновый QueueListener. Возвращает запущенный listener;
+    при выходе из программы он останавливается и дописывает очередь.
+    """
+    handler = handler if handler is not None else file_handler()
+    handler.setFormatter(
+        JsonFormatter() if json_format else logging.Formatter(LOG_FORMAT))
+    records = queue.SimpleQueue()
+    listener = QueueListener(records, handler, respect_handler_level=True)
+    root = logging.getLogger()
+    root.setLevel(level)
+    root.addHandler(RecordQueueHandler(records))
+    listener.start()
+    atexit.register(stop_logging, listener)
+    return listener
+
+
+def stop_logging(listener):
+    """Дописывает очередь и останавливает listener, если он ещё работает."""
+    if listener._thread is not None:
+        listener.stop()
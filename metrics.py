@@ -0,0 +1,355 @@
+"""Метрики бота в текстовом формате Prometheus."""
+import functools
+import logging
+import os
+import threading
+import time
+from bisect import bisect_left
+
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+DRIFT_BUCKETS = (0.01, 0.1, 1, 5, 30, 60, 300)
+STALE_AFTER = float(os.getenv('METRICS_STALE_AFTER', 3 * 60 * 60))
+
+logger = logging.getLogger(__name__)
+
+
+def _escape(value):
+    return (str(value).replace('\\', '\\\\')
+            .replace('"', '\\"').replace('\n', '\\n'))
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    inner = ','.join(f'{name}="{_escape(value)}"' for name, value in pairs)
+    return '{' + inner + '}'
+
+
+def _sample_lines(name, labelnames, samples, extra=()):
+    return [
+        f'{name}{suffix}'
+        f'{_format_labels(labelnames, key, tuple(extra) + tuple(labels))}'
+        f' {value}'
+        for suffix, key, labels, value in samples
+    ]
+
+
+class Metric:
+    """Базовая метрика: значения по наборам меток, защищённые замком."""
+
+    kind = 'untyped'
+
+    def __init__(self, name, documentation, labelnames=()):
+        """Имена меток labelnames задают порядок их вывода."""
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def samples(self):
+        """Пары (суффикс имени, значения меток, доп. метки, значение)."""
+        with self._lock:
+            return [('', key, (), value)
+                    for key, value in self._values.items()]
+
+    def family(self):
+        """Описание метрики и её значения в виде, пригодном для pickle."""
+        return (self.name, self.kind, self.documentation, self.labelnames,
+                self.samples())
+
+    def render(self, forwarded=()):
+        """Метрика в текстовом формате экспозиции.
+
+        forwarded — пары (воркер, значения) той же метрики из других
+        процессов; их значения получают метку worker.
+        """
+        lines = [f'# HELP {self.name} {self.documentation}',
+                 f'# TYPE {self.name} {self.kind}']
+        lines += _sample_lines(self.name, self.labelnames, self.samples())
+        for worker, samples in forwarded:
+            lines += _sample_lines(self.name, self.labelnames, samples,
+                                   (('worker', worker),))
+        return '\n'.join(lines)
+
+
+class Counter(Metric):
+    """Монотонно растущий счётчик."""
+
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        """Увеличивает счётчик для набора меток."""
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    """Текущее значение; может вычисляться при каждом чтении.
+
+    callback возвращает число или пары (значения меток, число).
+    """
+
+    kind = 'gauge'
+
+    def __init__(self, name, documentation, labelnames=(), callback=None):
+        """С callback значение не хранится, а вычисляется при выводе."""
+        super().__init__(name, documentation, labelnames)
+        self.callback = callback
+
+    def set(self, value, **labels):
+        """Устанавливает значение для набора меток."""
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def samples(self):
+        """Значения, в том числе вычисленные callback."""
+        if self.callback is None:
+            return super().samples()
+        result = self.callback()
+        if isinstance(result, (int, float)):
+            return [('', (), (), result)]
+        return [('', tuple(map(str, key)), (), value)
+                for key, value in result]
+
+
+class Histogram(Metric):
+    """Распределение значений по корзинам."""
+
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(),
+                 buckets=LATENCY_BUCKETS):
+        """Границы корзин buckets; +Inf добавляется при выводе."""
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        """Учитывает одно наблюдение."""
+        key = self._key(labels)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            counts = self._values.get(key)
+            if counts is None:
+                counts = self._values[key] = [0] * (len(self.buckets) + 3)
+            counts[index] += 1
+            counts[-2] += value
+            counts[-1] += 1
+
+    def time(self, **labels):
+        """Декоратор, замеряющий время работы функции."""
+        def decorator(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                started = time.perf_counter()
+                try:
+                    return func(*args, **kwargs)
+                finally:
+                    self.observe(time.perf_counter() - started, **labels)
+            return wrapper
+        return decorator
+
+    def samples(self):
+        """Накопительные корзины, сумма и число наблюдений."""
+        with self._lock:
+            values = {key: list(counts)
+                      for key, counts in self._values.items()}
+        samples = []
+        for key, counts in values.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf',), counts):
+                cumulative += count
+                samples.append(('_bucket', key, (('le', bound),), cumulative))
+            samples.append(('_sum', key, (), counts[-2]))
+            samples.append(('_count', key, (), counts[-1]))
+        return samples
+
+
+class Registry:
+    """Набор метрик процесса; метрика с тем же именем заменяется.
+
+    Процессы-воркеры присылают снимки своих метрик (snapshot()), и
+    forward() добавляет их к выдаче с меткой worker.
+    """
+
+    def __init__(self):
+        """Создаёт пустой набор метрик."""
+        self._metrics = {}
+        self._forwarded = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        """Добавляет метрику и возвращает её."""
+        with self._lock:
+            self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        """Создаёт и регистрирует счётчик."""
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=(), callback=None):
+        """Создаёт и регистрирует показатель."""
+        return self.register(
+            Gauge(name, documentation, labelnames, callback))
+
+    def histogram(self, name, documentation, labelnames=(),
+                  buckets=LATENCY_BUCKETS):
+        """Создаёт и регистрирует гистограмму."""
+        return self.register(
+            Histogram(name, documentation, labelnames, buckets))
+
+    def snapshot(self):
+        """Значения всех метрик для передачи в другой процесс."""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return [metric.family() for metric in metrics]
+
+    def forward(self, worker, snapshot):
+        """Запоминает последний снимок метрик воркера."""
+        with self._lock:
+            self._forwarded[worker] = snapshot
+
+    def forget(self, worker):
+        """Убирает метрики остановленного воркера."""
+        with self._lock:
+            self._forwarded.pop(worker, None)
+
+    def render(self):
+        """Все метрики в текстовом формате экспозиции."""
+        with self._lock:
+            metrics = list(self._metrics.values())
+            forwarded = dict(self._forwarded)
+        families = {}
+        for worker, snapshot in forwarded.items():
+            for name, kind, documentation, labelnames, samples in snapshot:
+                family = families.setdefault(
+                    name, [kind, documentation, labelnames, []])
+                family[3].append((worker, samples))
+        blocks = []
+        for metric in metrics:
+            family = families.pop(metric.name, None)
+            blocks.append(metric.render(family[3] if family else ()))
+        for name, (kind, documentation, labelnames, samples) in (
+                families.items()):
+            metric = Metric(name, documentation, labelnames)
+            metric.kind = kind
+            blocks.append(metric.render(samples))
+        return '\n'.join(blocks) + '\n'
+
+
+REGISTRY = Registry()
+
+POLL_LATENCY = REGISTRY.histogram(
+    'homework_poll_duration_seconds', 'Время запроса к API Практикума')
+API_ERRORS = REGISTRY.counter(
+    'homework_api_errors_total', 'Ошибки запросов к API', ('type',))
+VALIDATION_FAILURES = REGISTRY.counter(
+    'homework_validation_failures_total',
+    'Ответы API, не прошедшие проверку check_response')
+MESSAGES = REGISTRY.counter(
+    'homework_messages_total', 'Сообщения в Telegram', ('result',))
+SCHEDULE_DRIFT = REGISTRY.histogram(
+    'homework_schedule_drift_seconds',
+    'Опоздание опроса относительно расписания', buckets=DRIFT_BUCKETS)
+BUDGET_DEFERRALS = REGISTRY.counter(
+    'homework_budget_deferrals_total',
+    'Опросы, отложенные из-за лимита запросов к API')
+COALESCED_POLLS = REGISTRY.counter(
+    'homework_coalesced_polls_total',
+    'Опросы, получившие ответ чужого одновременного запроса с тем же токеном')
+JOURNAL_DROPS = REGISTRY.counter(
+    'homework_journal_dropped_total',
+    'Ответы API, не записанные в журнал из-за переполнения очереди')
+
+
+def count_errors(counter, exceptions):
+    """Декоратор: увеличивает counter, если функция бросила exceptions."""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            try:
+                return func(*args, **kwargs)
+            except exceptions:
+                counter.inc()
+                raise
+        return wrapper
+    return decorator
+
+
+def track_tenants(tenants, registry=REGISTRY, stale_after=STALE_AFTER):
+    """Регистрирует время с последнего успешного опроса подписок.
+
+    Отдельного ряда на подписку нет: их число не ограничено. Вместо этого
+    по подпискам не на паузе отдаются наибольшее отставание и число
+    не опрошенных успешно дольше stale_after секунд.
+    """
+    def max_staleness():
+        now = time.time()
+        return max((now - tenant.last_success for tenant in tenants
+                    if not tenant.paused), default=0)
+
+    def stale_tenants():
+        deadline = time.time() - stale_after
+        return sum(1 for tenant in tenants
+                   if not tenant.paused and tenant.last_success < deadline)
+
+    registry.gauge(
+        'homework_max_staleness_seconds',
+        'Наибольшее время с успешного опроса среди подписок не на паузе',
+        callback=max_staleness)
+    registry.gauge(
+        'homework_stale_tenants',
+        'Подписки без успешного опроса дольше METRICS_STALE_AFTER секунд',
+        callback=stale_tenants)
+
+
+def metrics_handler(registry=REGISTRY):
+    """Класс обработчика HTTP, отдающего метрики registry по GET /metrics.
+
+    http.server импортируется только здесь: без METRICS_PORT бот
+    не платит за его загрузку при запуске.
+    """
+    from http.server import BaseHTTPRequestHandler
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            """Отвечает текстом метрик или 404."""
+            if self.path.split('?')[0] != '/metrics':
+                self.send_error(404)
+                return
+            body = registry.render().encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            """Запросы к метрикам не пишутся в лог."""
+
+    return MetricsHandler
+
+
+def start_http_server(port, host=None, registry=REGISTRY):
+    """Запускает сервер метрик в фоновом потоке и возвращает его.
+
+    host по умолчанию берётся из METRICS_HOST (127.0.0.1).
+    """
+    from http.server import ThreadingHTTPServer
+
+    if host is None:
+        host = os.getenv('METRICS_HOST', '127.0.0.1')
+    server = ThreadingHTTPServer((host, port), metrics_handler(registry))
+    server.daemon_threads = True
+    thread = threading.Thread(
+        target=server.serve_forever, name='metrics', daemon=True)
+    thread.start()
+    logger.info(f'Метрики доступны на http://{host}:{server.server_port}'
+                '/metrics')
+    return server
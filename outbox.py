@@ -0,0 +1,173 @@
+"""Очередь исходящих сообщений Telegram с ограничением частоты."""
+import asyncio
+import logging
+import os
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from telegram.error import BadRequest, NetworkError, RetryAfter
+
+import metrics
+from ratelimit import TokenBucket
+
+OUTBOX_WORKERS = int(os.getenv('OUTBOX_WORKERS', 8))
+OUTBOX_MAX_ATTEMPTS = int(os.getenv('OUTBOX_MAX_ATTEMPTS', 5))
+OUTBOX_RETRY_DELAY = float(os.getenv('OUTBOX_RETRY_DELAY', 1))
+TELEGRAM_GLOBAL_RATE = float(os.getenv('TELEGRAM_GLOBAL_RATE', 30))
+TELEGRAM_CHAT_RATE = float(os.getenv('TELEGRAM_CHAT_RATE', 1))
+
+logger = logging.getLogger(__name__)
+
+
+class Outbox:
+    """Доставляет сообщения в Telegram независимо от опроса API.
+
+    Сообщения одного чата уходят строго по порядку и не чаще
+    chat_rate в секунду, все чаты вместе — не чаще global_rate.
+    На RetryAfter чат откладывается на указанное сервером время,
+    на сетевые ошибки — с растущей паузой до max_attempts попыток.
+    Квитанции сообщения передаются в on_sent только после того, как
+    Telegram его принял; сообщение, не ушедшее до остановки, своих
+    квитанций не отдаёт.
+    """
+
+    def __init__(self, bot, workers=OUTBOX_WORKERS,
+                 global_rate=TELEGRAM_GLOBAL_RATE,
+                 chat_rate=TELEGRAM_CHAT_RATE,
+                 max_attempts=OUTBOX_MAX_ATTEMPTS,
+                 retry_delay=OUTBOX_RETRY_DELAY, on_sent=None):
+        """Отправляют workers потоков; обработчики запускает start()."""
+        self.bot = bot
+        self.workers = workers
+        self.chat_rate = chat_rate
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.on_sent = on_sent
+        self.depth = 0
+        self._global = TokenBucket(global_rate)
+        self._buckets = {}
+        self._pending = {}
+        self._attempts = {}
+        self._executor = ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix='telegram')
+        self._ready = None
+        self._empty = None
+        self._loop = None
+        self._tasks = []
+
+    def start(self):
+        """Запускает обработчиков очереди в текущем цикле событий."""
+        if self._ready is None:
+            self._loop = asyncio.get_running_loop()
+            self._ready = asyncio.Queue()
+            self._empty = asyncio.Event()
+            self._empty.set()
+        if not self._tasks:
+            self._tasks = [
+                asyncio.ensure_future(self._worker())
+                for _ in range(self.workers)
+            ]
+
+    def put(self, chat_id, text, receipts=None):
+        """Ставит сообщение в очередь чата, не дожидаясь отправки."""
+        self.start()
+        queue = self._pending.get(chat_id)
+        if queue is None:
+            queue = self._pending[chat_id] = deque()
+            self._ready.put_nowait(chat_id)
+        queue.append((text, receipts))
+        self.depth += 1
+        self._empty.clear()
+
+    def put_threadsafe(self, chat_id, text):
+        """Ставит сообщение в очередь из другого потока."""
+        self._loop.call_soon_threadsafe(self.put, chat_id, text)
+
+    async def drain(self, timeout=None):
+        """Ждёт, пока очередь опустеет; возвращает False по таймауту."""
+        if self._empty is None:
+            return True
+        try:
+            await asyncio.wait_for(self._empty.wait(), timeout)
+        except asyncio.TimeoutError:
+            return False
+        return True
+
+    async def stop(self):
+        """Останавливает обработчиков; неотправленное остаётся в очереди."""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._executor.shutdown(wait=False)
+
+    async def _acquire(self, chat_id):
+        bucket = self._buckets.get(chat_id)
+        if bucket is None:
+            bucket = self._buckets[chat_id] = TokenBucket(self.chat_rate, 1)
+        while True:
+            delay = max(bucket.delay(), self._global.delay())
+            if not delay:
+                bucket.take()
+                self._global.take()
+                return
+            await asyncio.sleep(delay)
+
+    def _retry_later(self, chat_id, delay):
+        asyncio.get_running_loop().call_later(
+            delay, self._ready.put_nowait, chat_id)
+
+    def _done(self, chat_id):
+        self._attempts.pop(chat_id, None)
+        queue = self._pending[chat_id]
+        queue.popleft()
+        self.depth -= 1
+        if queue:
+            self._ready.put_nowait(chat_id)
+        else:
+            del self._pending[chat_id]
+        if not self.depth:
+            self._empty.set()
+
+    async def _worker(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            chat_id = await self._ready.get()
+            await self._acquire(chat_id)
+            text, receipts = self._pending[chat_id][0]
+            try:
+                await loop.run_in_executor(
+                    self._executor, self.bot.send_message, chat_id, text)
+            except RetryAfter as error:
+                logger.warning(f'Telegram просит подождать '
+                               f'{error.retry_after} с перед отправкой '
+                               f'в чат {chat_id}')
+                self._retry_later(chat_id, error.retry_after)
+                continue
+            except BadRequest as error:
+                metrics.MESSAGES.inc(result='failed')
+                logger.error(f'Сбой при отправке сообщения: {error}',
+                             exc_info=True)
+            except NetworkError as error:
+                attempts = self._attempts.get(chat_id, 0) + 1
+                if attempts < self.max_attempts:
+                    logger.warning(f'Сетевая ошибка при отправке в чат '
+                                   f'{chat_id}, попытка {attempts}: {error}')
+                    self._attempts[chat_id] = attempts
+                    self._retry_later(
+                        chat_id, self.retry_delay * 2 ** (attempts - 1))
+                    continue
+                metrics.MESSAGES.inc(result='failed')
+                logger.error(f'Сообщение в чат {chat_id} не отправлено '
+                             f'после {attempts} попыток: {error}')
+            except Exception as error:
+                metrics.MESSAGES.inc(result='failed')
+                logger.error(
+                    'При отправке сообщения в телеграмм произошла ошибка: '
+                    f'{error}', exc_info=True)
+            else:
+                metrics.MESSAGES.inc(result='sent')
+                logger.debug('Сообщение успешно отправлено')
+                if receipts and self.on_sent is not None:
+                    self.on_sent(receipts)
+            self._done(chat_id)
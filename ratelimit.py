@@ -0,0 +1,101 @@
+"""Ограничение частоты запросов алгоритмом token bucket."""
+import threading
+import time
+
+
+class TokenBucket:
+    """Ведро на capacity токенов, пополняемое со скоростью rate в секунду."""
+
+    def __init__(self, rate, capacity=None, clock=time.monotonic):
+        """Ведро создаётся полным; по умолчанию вмещает секунду запросов."""
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(rate, 1)
+        self.tokens = self.capacity
+        self.clock = clock
+        self.updated = clock()
+
+    def _refill(self):
+        now = self.clock()
+        self.tokens = min(
+            self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self, tokens=1):
+        """Секунды до того, как в ведре наберётся tokens токенов."""
+        self._refill()
+        if self.tokens >= tokens:
+            return 0
+        return (tokens - self.tokens) / self.rate
+
+    def take(self, tokens=1):
+        """Забирает токены, не проверяя их наличие."""
+        self._refill()
+        self.tokens -= tokens
+
+    def try_acquire(self, tokens=1):
+        """Забирает токены, если они есть, и сообщает об успехе."""
+        if self.delay(tokens):
+            return False
+        self.tokens -= tokens
+        return True
+
+
+class RequestBudget:
+    """Лимиты запросов: свой для каждого токена и общий на все токены.
+
+    Лимит с нулевой скоростью не действует. Ведро токена создаётся при
+    первом запросе с этим токеном. Методы можно вызывать из разных
+    потоков.
+    """
+
+    def __init__(self, token_rate=0, global_rate=0, token_burst=None,
+                 global_burst=None, clock=time.monotonic):
+        """Ёмкость вёдер по умолчанию — секунда запросов их лимита."""
+        self.token_rate = token_rate
+        self.token_burst = token_burst
+        self.clock = clock
+        self.total = (TokenBucket(global_rate, global_burst, clock)
+                      if global_rate else None)
+        self.buckets = {}
+        self._lock = threading.Lock()
+
+    def _buckets(self, key):
+        buckets = [] if self.total is None else [self.total]
+        if self.token_rate:
+            bucket = self.buckets.get(key)
+            if bucket is None:
+                bucket = self.buckets[key] = TokenBucket(
+                    self.token_rate, self.token_burst, self.clock)
+            buckets.append(bucket)
+        return buckets
+
+    def delay(self, key):
+        """Секунды до того, как запрос с токеном key уложится в лимиты."""
+        with self._lock:
+            return max(
+                (bucket.delay() for bucket in self._buckets(key)), default=0)
+
+    def acquire(self, key):
+        """Учитывает запрос, если он укладывается в лимиты.
+
+        Возвращает 0, если запрос можно делать, иначе секунды ожидания;
+        в этом случае запрос не учитывается.
+        """
+        with self._lock:
+            buckets = self._buckets(key)
+            wait = max((bucket.delay() for bucket in buckets), default=0)
+            if not wait:
+                for bucket in buckets:
+                    bucket.take()
+            return wait
+
+    def scale(self, share):
+        """Оставляет процессу долю share общего лимита.
+
+        Лимиты токенов не делятся: все подписки токена опрашивает один
+        процесс (sharding.shard_key), и его ведро токена единственное.
+        """
+        if self.total is not None:
+            self.total.rate *= share
+            self.total.capacity = max(self.total.capacity * share, 1)
+            self.total.tokens = min(self.total.tokens, self.total.capacity)
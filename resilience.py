@@ -0,0 +1,129 @@
+"""Повторы запросов к API и общий предохранитель от каскадных сбоев."""
+import asyncio
+import os
+import random
+import threading
+import time
+
+from exceptions import (ApiNotFoundError, BudgetExceeded, CircuitOpenError,
+                        StatusCodeError)
+
+API_RETRY_ATTEMPTS = int(os.getenv('API_RETRY_ATTEMPTS', 3))
+API_RETRY_BASE = float(os.getenv('API_RETRY_BASE', 1))
+API_RETRY_CAP = float(os.getenv('API_RETRY_CAP', 30))
+BREAKER_THRESHOLD = int(os.getenv('BREAKER_THRESHOLD', 5))
+BREAKER_RESET = float(os.getenv('BREAKER_RESET', 60))
+BREAKER_PROBES = int(os.getenv('BREAKER_PROBES', 1))
+
+
+def is_transient(error):
+    """Сбой на стороне API или сети, который имеет смысл повторить."""
+    if isinstance(error, StatusCodeError):
+        return error.status_code is not None and error.status_code >= 500
+    return isinstance(error, ApiNotFoundError)
+
+
+def decorrelated_jitter(base=API_RETRY_BASE, cap=API_RETRY_CAP, rng=random):
+    """Паузы между повторами: случайные, растущие, не больше cap.
+
+    Случайный разброс не даёт подпискам повторять запросы синхронно,
+    когда API восстанавливается после сбоя.
+    """
+    delay = base
+    while True:
+        delay = min(cap, rng.uniform(base, delay * 3))
+        yield delay
+
+
+class CircuitBreaker:
+    """Предохранитель, общий для всех подписок.
+
+    После threshold подряд сбоев API (5xx, таймауты, обрывы) запросы
+    не выполняются reset_timeout секунд. Затем пропускается не больше
+    probes пробных запросов: успех замыкает цепь, сбой снова её
+    размыкает.
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, threshold=BREAKER_THRESHOLD,
+                 reset_timeout=BREAKER_RESET, probes=BREAKER_PROBES,
+                 clock=time.monotonic):
+        """Цепь изначально замкнута."""
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.probes = probes
+        self.clock = clock
+        self.state = self.CLOSED
+        self.failures = 0
+        self._opened_at = 0
+        self._probes_in_flight = 0
+        self._lock = threading.Lock()
+
+    def allow(self):
+        """Можно ли сейчас делать запрос."""
+        with self._lock:
+            if self.state == self.OPEN:
+                if self.clock() - self._opened_at < self.reset_timeout:
+                    return False
+                self.state = self.HALF_OPEN
+                self._probes_in_flight = 0
+            if self.state == self.HALF_OPEN:
+                if self._probes_in_flight >= self.probes:
+                    return False
+                self._probes_in_flight += 1
+            return True
+
+    def release(self):
+        """Возвращает разрешение на запрос, который не был отправлен."""
+        with self._lock:
+            if self.state == self.HALF_OPEN and self._probes_in_flight:
+                self._probes_in_flight -= 1
+
+    def record_success(self):
+        """API ответил: цепь замыкается, счётчик сбоев обнуляется."""
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+
+    def record_failure(self):
+        """Учитывает сбой API и при необходимости размыкает цепь."""
+        with self._lock:
+            self.failures += 1
+            if (self.state == self.HALF_OPEN
+                    or self.failures >= self.threshold):
+                self.state = self.OPEN
+                self._opened_at = self.clock()
+
+
+async def call_with_retries(request, breaker, attempts=API_RETRY_ATTEMPTS,
+                            delays=None, sleep=asyncio.sleep):
+    """Выполняет корутину request() с повторами через предохранитель.
+
+    Повторяются только временные сбои API, остальные ошибки
+    пробрасываются сразу. Запрос, не отправленный из-за лимита
+    (BudgetExceeded), не считается ни сбоем, ни успехом API.
+    """
+    delays = delays if delays is not None else decorrelated_jitter()
+    for attempt in range(1, attempts + 1):
+        if not breaker.allow():
+            raise CircuitOpenError(
+                'Запросы к API приостановлены после серии сбоев')
+        try:
+            result = await request()
+        except BudgetExceeded:
+            breaker.release()
+            raise
+        except Exception as error:
+            if not is_transient(error):
+                breaker.record_success()
+                raise
+            breaker.record_failure()
+            if attempt == attempts:
+                raise
+            await sleep(next(delays))
+        else:
+            breaker.record_success()
+            return result
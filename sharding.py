@@ -0,0 +1,499 @@
+"""Распределение подписок по процессам-воркерам.
+
+Один процесс упирается в GIL: разбор JSON и проверка ответов API идут
+в одном ядре. Супервизор запускает воркеры (по умолчанию по одному на
+ядро), делит между ними подписки согласованным хешированием по токену
+и сам отправляет в Telegram всё, что воркеры присылают через общую
+очередь, соблюдая общие ограничения частоты.
+
+Если воркер умирает, его подписки сразу переходят к остальным, а через
+SHARD_RESTART_DELAY запускается замена. При появлении нового воркера
+к нему переезжают только те подписки, что попадают на него в кольце:
+прежний владелец снимает подписку с опроса и передаёт её состояние.
+"""
+import asyncio
+import bisect
+import hashlib
+import logging
+import multiprocessing
+import os
+import threading
+from collections import namedtuple
+from logging.handlers import QueueListener
+
+import journal
+import metrics
+from engine import PollingEngine
+from log_config import RecordQueueHandler
+from outbox import Outbox
+from shutdown import SHUTDOWN_SIGNALS, SHUTDOWN_TIMEOUT
+from state import HomeworkStates, TenantState
+
+SHARD_WORKERS = os.getenv('SHARD_WORKERS', '1')
+SHARD_REPLICAS = int(os.getenv('SHARD_REPLICAS', 64))
+SHARD_RESTART_DELAY = float(os.getenv('SHARD_RESTART_DELAY', 5))
+SHARD_CHECK_INTERVAL = 1
+SHARD_METRICS_INTERVAL = float(os.getenv('SHARD_METRICS_INTERVAL', 5))
+
+Worker = namedtuple('Worker', ('process', 'control'))
+
+logger = logging.getLogger(__name__)
+
+
+def worker_count(value=SHARD_WORKERS):
+    """Число воркеров из SHARD_WORKERS; auto — по числу ядер."""
+    if value == 'auto':
+        return os.cpu_count() or 1
+    return max(1, int(value))
+
+
+def ring_hash(value):
+    """Положение строки на кольце."""
+    digest = hashlib.blake2b(value.encode(), digest_size=8).digest()
+    return int.from_bytes(digest, 'big')
+
+
+def shard_key(key):
+    """Часть ключа подписки, по которой выбирается воркер.
+
+    Это хэш токена без chat_id: все чаты одного студента опрашивает
+    один воркер, поэтому их одновременные запросы объединяются, а лимит
+    запросов токена соблюдается в одном процессе.
+    """
+    return key.partition(':')[0]
+
+
+class HashRing:
+    """Кольцо согласованного хеширования.
+
+    Каждый узел занимает replicas точек кольца, ключ принадлежит
+    первому узлу по часовой стрелке. При добавлении или удалении
+    узла переезжают только ключи этого узла.
+    """
+
+    def __init__(self, nodes=(), replicas=SHARD_REPLICAS):
+        """Кладёт на кольцо узлы nodes."""
+        self.replicas = replicas
+        self._points = []
+        self._nodes = []
+        for node in nodes:
+            self.add(node)
+
+    def __contains__(self, node):
+        """Есть ли узел на кольце."""
+        return node in self._nodes
+
+    def __len__(self):
+        """Число узлов на кольце."""
+        return len(set(self._nodes))
+
+    def add(self, node):
+        """Добавляет узел на кольцо."""
+        for replica in range(self.replicas):
+            point = ring_hash(f'{node}#{replica}')
+            index = bisect.bisect(self._points, point)
+            self._points.insert(index, point)
+            self._nodes.insert(index, node)
+
+    def remove(self, node):
+        """Убирает узел с кольца."""
+        kept = [(point, owner) for point, owner
+                in zip(self._points, self._nodes) if owner != node]
+        self._points = [point for point, _ in kept]
+        self._nodes = [owner for _, owner in kept]
+
+    def node_for(self, key):
+        """Узел, которому принадлежит ключ."""
+        if not self._points:
+            raise LookupError('На кольце нет ни одного узла')
+        index = bisect.bisect(self._points, ring_hash(key))
+        return self._nodes[index % len(self._points)]
+
+
+def tenant_entry(tenant, with_state=False):
+    """Подписка в виде словаря, который можно передать воркеру.
+
+    С with_state в словарь входят курсор, статусы и пауза, чтобы
+    новый владелец продолжил с того же места.
+    """
+    entry = {'practicum_token': tenant.token, 'chat_id': tenant.chat_id}
+    if with_state:
+        entry['timestamp'] = tenant.timestamp
+        entry['statuses'] = dict(tenant.homeworks.statuses)
+        entry['paused'] = tenant.paused
+    return entry
+
+
+def tenant_from_entry(entry):
+    """Подписка из словаря tenant_entry()."""
+    tenant = TenantState(entry['practicum_token'], entry['chat_id'])
+    if 'timestamp' in entry:
+        tenant.timestamp = entry['timestamp']
+        tenant.homeworks = HomeworkStates(entry['statuses'])
+        tenant.paused = entry['paused']
+    return tenant
+
+
+class QueueOutbox:
+    """Outbox воркера: передаёт сообщения общему отправителю супервизора.
+
+    Ограничения частоты и повторы отправки — на стороне супервизора.
+    """
+
+    bot = None
+    depth = 0
+
+    def __init__(self, results):
+        """Сообщения кладутся в очередь results супервизора."""
+        self.results = results
+
+    def start(self):
+        """Ничего не запускает: отправкой занимается супервизор."""
+
+    def put(self, chat_id, text, receipts=None):
+        """Передаёт сообщение супервизору вместе с его квитанциями."""
+        self.results.put(('send', chat_id, text, receipts))
+
+    put_threadsafe = put
+
+    async def drain(self, timeout=None):
+        """Очередь воркера всегда пуста."""
+        return True
+
+    async def stop(self):
+        """Останавливать нечего."""
+
+
+def run_worker(node, entries, pipeline, period, results, control, logs,
+               storage_path=None, alert_chat_id=None, budget_share=1):
+    """Точка входа процесса-воркера.
+
+    Логи уходят супервизору через очередь logs, команды add, remove
+    и stop приходят через control.
+    """
+    root = logging.getLogger()
+    root.handlers[:] = [RecordQueueHandler(logs)]
+    root.setLevel(os.getenv('LOG_LEVEL', 'INFO'))
+    journal.use_worker_file(node)
+    storage = None
+    if storage_path:
+        from storage import StateStorage
+
+        storage = StateStorage(storage_path)
+    engine = PollingEngine(
+        None, [tenant_from_entry(entry) for entry in entries], pipeline,
+        period, storage=storage, alert_chat_id=alert_chat_id,
+        outbox=QueueOutbox(results))
+    engine.policy.budget *= budget_share
+    # Общий лимит делится между воркерами. Лимит токена — нет: подписки
+    # токена живут в одном воркере, см. shard_key().
+    if pipeline.delay is not None:
+        import http_client
+
+        budget = http_client.get_client().budget
+        if budget is not None:
+            budget.scale(budget_share)
+    asyncio.run(ShardWorker(node, engine, results, control).run())
+
+
+class ShardWorker:
+    """Движок опроса воркера и исполнение команд супервизора."""
+
+    def __init__(self, node, engine, results, control):
+        """Команды приходят через control, ответы уходят в results."""
+        self.node = node
+        self.engine = engine
+        self.results = results
+        self.control = control
+        self._commands = None
+        self._loop = None
+
+    async def run(self):
+        """Опрашивает свои подписки до команды stop или сигнала."""
+        self._loop = asyncio.get_running_loop()
+        self._commands = asyncio.Queue()
+        threading.Thread(
+            target=self._listen, name='control', daemon=True).start()
+        applying = asyncio.ensure_future(self._apply())
+        reporting = asyncio.ensure_future(self._report_metrics())
+        try:
+            await self.engine.run(handle_signals=True)
+        finally:
+            applying.cancel()
+            reporting.cancel()
+
+    async def _report_metrics(self):
+        """Присылает супервизору снимок метрик воркера.
+
+        Метрики опроса (задержки, ошибки API, давность опроса) живут
+        в процессе воркера; наружу их отдаёт сервер метрик супервизора.
+        """
+        while True:
+            await asyncio.sleep(SHARD_METRICS_INTERVAL)
+            self.results.put(
+                ('metrics', self.node, metrics.REGISTRY.snapshot()))
+
+    def _listen(self):
+        while True:
+            command = self.control.get()
+            self._loop.call_soon_threadsafe(
+                self._commands.put_nowait, command)
+            if command[0] == 'stop':
+                return
+
+    async def _apply(self):
+        while not self.engine.running:
+            await asyncio.sleep(0.05)
+        while True:
+            action, *args = await self._commands.get()
+            try:
+                getattr(self, action)(*args)
+            except Exception as error:
+                logger.exception(
+                    f'{self.node}: сбой команды {action}: {error}')
+
+    def add(self, entry):
+        """Берёт подписку; без переданного состояния — из хранилища."""
+        tenant = tenant_from_entry(entry)
+        if 'timestamp' not in entry and self.engine.storage is not None:
+            self.engine.storage.restore(tenant)
+        self.engine.add_tenant(tenant)
+
+    def remove(self, key):
+        """Отдаёт подписку и возвращает супервизору её состояние."""
+        tenant = self.engine.remove_tenant(key)
+        entry = None
+        if tenant is not None:
+            entry = tenant_entry(tenant, with_state=True)
+            if self.engine.storage is not None:
+                self.engine.storage.flush()
+        self.results.put(('released', self.node, key, entry))
+
+    def stop(self):
+        """Останавливает движок воркера."""
+        self.engine.stop()
+
+
+class Supervisor:
+    """Запускает воркеры, раздаёт им подписки и отправляет их сообщения."""
+
+    def __init__(self, bot, tenants, pipeline, period,
+                 workers=None, storage_path=None, alert_chat_id=None,
+                 restart_delay=SHARD_RESTART_DELAY,
+                 shutdown_timeout=SHUTDOWN_TIMEOUT, context=None):
+        """Воркеры запускаются в run(), по умолчанию процессами spawn."""
+        self.context = context or multiprocessing.get_context('spawn')
+        self.outbox = Outbox(bot, on_sent=self._delivered)
+        self.storage = None
+        if storage_path:
+            from storage import StateStorage
+
+            self.storage = StateStorage(storage_path)
+        self.entries = {tenant.key: tenant_entry(tenant) for tenant in tenants}
+        self.pipeline = pipeline
+        self.period = period
+        self.count = workers or worker_count()
+        self.storage_path = storage_path
+        self.alert_chat_id = alert_chat_id
+        self.restart_delay = restart_delay
+        self.shutdown_timeout = shutdown_timeout
+        self.ring = HashRing()
+        self.owners = {}
+        self.moving = {}
+        self.workers = {}
+        self.results = self.context.Queue()
+        self.logs = self.context.Queue()
+        self.stopping = False
+        self._started = 0
+        self._stopped = None
+        self._loop = None
+
+    async def run(self, handle_signals=False):
+        """Работает до stop() или сигнала остановки."""
+        self._loop = asyncio.get_running_loop()
+        self._stopped = asyncio.Event()
+        if handle_signals:
+            for signum in SHUTDOWN_SIGNALS:
+                self._loop.add_signal_handler(signum, self.stop)
+        self.outbox.start()
+        self._register_metrics()
+        log_listener = QueueListener(
+            self.logs, *logging.getLogger().handlers,
+            respect_handler_level=True)
+        log_listener.start()
+        reader = threading.Thread(
+            target=self._read_results, name='results', daemon=True)
+        reader.start()
+        nodes = [self._new_node() for _ in range(self.count)]
+        for node in nodes:
+            self.ring.add(node)
+        for key in self.entries:
+            self.owners[key] = self.ring.node_for(shard_key(key))
+        for node in nodes:
+            self._start(node, [
+                self.entries[key]
+                for key, owner in self.owners.items() if owner == node
+            ])
+        logger.info(f'Запущено {len(nodes)} воркеров '
+                    f'для {len(self.entries)} подписок')
+        try:
+            while not self._stopped.is_set():
+                try:
+                    await asyncio.wait_for(
+                        self._stopped.wait(), SHARD_CHECK_INTERVAL)
+                except asyncio.TimeoutError:
+                    self._check_workers()
+                    await self._flush()
+        finally:
+            await self._shutdown(reader)
+            log_listener.stop()
+            for worker in self.workers.values():
+                worker.control.close()
+            self.results.close()
+            self.logs.close()
+
+    def stop(self):
+        """Просит супервизор остановить воркеры и завершиться."""
+        if self._stopped is not None and not self._stopped.is_set():
+            logger.info('Остановка воркеров')
+            self._stopped.set()
+
+    def _delivered(self, receipts):
+        """Снимает с хранения уведомления, которые принял Telegram.
+
+        Воркер сохраняет уведомление до передачи супервизору, а удалить
+        запись может только супервизор: лишь он знает, что сообщение
+        отправлено.
+        """
+        if self.storage is not None:
+            self.storage.stage_sent(receipts)
+
+    async def _flush(self):
+        if self.storage is not None:
+            await self._loop.run_in_executor(None, self.storage.flush)
+
+    def _register_metrics(self):
+        metrics.REGISTRY.gauge(
+            'homework_outbox_depth', 'Сообщения в очереди на отправку',
+            callback=lambda: self.outbox.depth)
+        metrics.REGISTRY.gauge(
+            'homework_shard_workers', 'Работающие процессы-воркеры',
+            callback=lambda: len(self.workers))
+
+    def _new_node(self):
+        self._started += 1
+        return f'worker-{self._started}'
+
+    def _start(self, node, entries):
+        control = self.context.Queue()
+        process = self.context.Process(
+            target=run_worker, name=node, daemon=True,
+            args=(node, entries, self.pipeline, self.period, self.results,
+                  control, self.logs, self.storage_path,
+                  self.alert_chat_id, 1 / self.count))
+        process.start()
+        self.workers[node] = Worker(process, control)
+
+    def _assign(self, key, node, entry=None):
+        self.owners[key] = node
+        self.workers[node].control.put(('add', entry or self.entries[key]))
+
+    def _read_results(self):
+        while True:
+            item = self.results.get()
+            if item is None:
+                return
+            self._loop.call_soon_threadsafe(self._on_result, item)
+
+    def _on_result(self, item):
+        action, *args = item
+        if action == 'send':
+            self.outbox.put(*args)
+        elif action == 'metrics':
+            if args[0] in self.workers:
+                metrics.REGISTRY.forward(*args)
+        elif action == 'released':
+            _, key, entry = args
+            target = self.moving.pop(key, None)
+            if self.stopping or key not in self.owners:
+                return
+            if target not in self.workers:
+                target = self.ring.node_for(shard_key(key))
+            self._assign(key, target, entry)
+
+    def _check_workers(self):
+        for node, worker in list(self.workers.items()):
+            if not worker.process.is_alive():
+                self._on_death(node, worker.process.exitcode)
+
+    def _on_death(self, node, exitcode):
+        self.workers.pop(node).control.close()
+        self.ring.remove(node)
+        metrics.REGISTRY.forget(node)
+        logger.error(f'Воркер {node} завершился с кодом {exitcode}, '
+                     'его подписки переданы остальным')
+        for key, owner in self.owners.items():
+            if owner != node:
+                continue
+            target = self.moving.pop(key, None)
+            if target not in self.workers:
+                target = (self.ring.node_for(shard_key(key))
+                          if self.workers else None)
+            if target is None:
+                self.owners[key] = None
+            else:
+                self._assign(key, target)
+        self._loop.call_later(self.restart_delay, self._replace)
+
+    def _replace(self):
+        if self.stopping:
+            return
+        node = self._new_node()
+        self.ring.add(node)
+        self._start(node, [])
+        logger.info(f'Запущен воркер {node} на замену')
+        for key, owner in self.owners.items():
+            target = self.ring.node_for(shard_key(key))
+            if owner is None:
+                self._assign(key, target)
+            elif target != owner and key not in self.moving:
+                self.moving[key] = target
+                self.workers[owner].control.put(('remove', key))
+
+    def _join_workers(self, timeout):
+        deadline = self._loop.time() + timeout
+        for worker in self.workers.values():
+            worker.process.join(max(0, deadline - self._loop.time()))
+            if worker.process.is_alive():
+                logger.warning(f'Воркер {worker.process.name} не завершился '
+                               f'за {timeout} с и будет остановлен')
+                worker.process.terminate()
+
+    async def _shutdown(self, reader):
+        """Останавливает воркеры и дописывает их сообщения в Telegram."""
+        self.stopping = True
+        deadline = self._loop.time() + self.shutdown_timeout
+        for worker in self.workers.values():
+            worker.control.put(('stop',))
+        await self._loop.run_in_executor(
+            None, self._join_workers, self.shutdown_timeout)
+        self.results.put(None)
+        await self._loop.run_in_executor(None, reader.join)
+        for node in self.workers:
+            metrics.REGISTRY.forget(node)
+        await asyncio.sleep(0)
+        remaining = max(1, deadline - self._loop.time())
+        if not await self.outbox.drain(timeout=remaining):
+            logger.warning(f'Не отправлено {self.outbox.depth} сообщений')
+        await self.outbox.stop()
+        if self.storage is not None:
+            self.storage.close()
+
+
+def run(bot, tenants, pipeline, period, workers=None, storage_path=None,
+        alert_chat_id=None):
+    """Запускает супервизор в новом цикле событий."""
+    supervisor = Supervisor(bot, tenants, pipeline, period, workers=workers,
+                            storage_path=storage_path,
+                            alert_chat_id=alert_chat_id)
+    asyncio.run(supervisor.run(handle_signals=True))
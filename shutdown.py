@@ -0,0 +1,59 @@
+"""Остановка бота по SIGTERM и SIGINT без обрыва отправки сообщений."""
+import logging
+import os
+import signal
+from contextlib import contextmanager
+
+from exceptions import ShutdownRequested
+
+SHUTDOWN_TIMEOUT = float(os.getenv('SHUTDOWN_TIMEOUT', 10))
+SHUTDOWN_SIGNALS = (signal.SIGTERM, signal.SIGINT)
+
+logger = logging.getLogger(__name__)
+
+
+class GracefulExit:
+    """Перехватывает сигналы остановки на время блока with.
+
+    Сигнал только отмечает, что пора остановиться: начатые запрос
+    и отправка сообщения завершаются. Ожидание внутри interruptible()
+    прерывается сразу — обработчик сигнала бросает ShutdownRequested.
+    При выходе из блока восстанавливаются прежние обработчики.
+    """
+
+    def __init__(self, signals=SHUTDOWN_SIGNALS):
+        """Сигналы signals перехватываются только на время блока."""
+        self.signals = signals
+        self.requested = False
+        self._waiting = False
+        self._previous = {}
+
+    def __enter__(self):
+        """Ставит свои обработчики сигналов."""
+        for signum in self.signals:
+            self._previous[signum] = signal.signal(signum, self._handle)
+        return self
+
+    def __exit__(self, *exc_info):
+        """Возвращает прежние обработчики сигналов."""
+        for signum, handler in self._previous.items():
+            signal.signal(signum, handler)
+        self._previous.clear()
+
+    def _handle(self, signum, frame):
+        logger.info(f'Получен сигнал {signal.Signals(signum).name}, '
+                    'бот останавливается')
+        self.requested = True
+        if self._waiting:
+            raise ShutdownRequested(signal.Signals(signum).name)
+
+    @contextmanager
+    def interruptible(self):
+        """Блок ожидания, который сигнал остановки прерывает сразу."""
+        if self.requested:
+            raise ShutdownRequested('остановка запрошена раньше')
+        self._waiting = True
+        try:
+            yield
+        finally:
+            self._waiting = False
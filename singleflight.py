@@ -0,0 +1,44 @@
+"""Объединение одновременных одинаковых запросов в один."""
+import asyncio
+
+
+class SingleFlight:
+    """Выполняет одновременные вызовы с одним ключом один раз.
+
+    Первый вызов do() с ключом запускает корутину, остальные ждут её
+    результата или исключения. Отмена ожидающего не отменяет общий
+    вызов: его результат нужен остальным. Когда вызов завершён,
+    следующий do() с тем же ключом запускает его заново.
+    """
+
+    def __init__(self):
+        """Создаёт объединитель без выполняющихся вызовов."""
+        self._calls = {}
+
+    def __contains__(self, key):
+        """Выполняется ли сейчас вызов с ключом key."""
+        return key in self._calls
+
+    def __len__(self):
+        """Число выполняющихся вызовов."""
+        return len(self._calls)
+
+    async def do(self, key, func):
+        """Результат func() для ключа key, общий для одновременных вызовов."""
+        call = self._calls.get(key)
+        if call is None:
+            call = asyncio.ensure_future(func())
+            self._calls[key] = call
+            call.add_done_callback(lambda done: self._forget(key, done))
+        return await asyncio.shield(call)
+
+    def _forget(self, key, call):
+        if self._calls.get(key) is call:
+            del self._calls[key]
+        if not call.cancelled():
+            call.exception()
+
+    def cancel_all(self):
+        """Отменяет все незавершённые вызовы."""
+        for call in list(self._calls.values()):
+            call.cancel()
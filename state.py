@@ -0,0 +1,207 @@
+"""Состояние подписок, которое движок хранит между опросами."""
+import hashlib
+import re
+import sys
+import time
+from collections import namedtuple
+
+CURRENT_DATE = re.compile(rb'"current_date"\s*:\s*(\d+)')
+
+TENANT_MEMORY_BUDGET = 1024
+
+
+def next_timestamp(api_answer, timestamp):
+    """Возвращает from_date для следующего запроса.
+
+    Курсор сдвигается на current_date из ответа API, чтобы следующий
+    запрос вернул только изменения после этого момента.
+    """
+    current_date = api_answer.get('current_date')
+    if isinstance(current_date, int) and current_date > timestamp:
+        return current_date
+    return timestamp
+
+
+def fingerprint(body):
+    """Отпечаток тела ответа API и значение current_date из него.
+
+    current_date меняется в каждом ответе, поэтому в отпечаток
+    не входит: одинаковые по сути ответы дают одинаковый отпечаток,
+    а курсор можно сдвинуть без разбора JSON.
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    match = CURRENT_DATE.search(body)
+    if match is None:
+        digest.update(body)
+        return digest.digest(), None
+    view = memoryview(body)
+    digest.update(view[:match.start(1)])
+    digest.update(view[match.end(1):])
+    return digest.digest(), int(match.group(1))
+
+
+def tenant_key(token, chat_id):
+    """Ключ подписки в хранилище, не раскрывающий токен."""
+    digest = hashlib.sha256(str(token).encode()).hexdigest()[:16]
+    return f'{digest}:{chat_id}'
+
+
+Homework = namedtuple('Homework', ('key', 'name', 'status'))
+Homework.__doc__ = """Проверенная запись о работе.
+
+key — id работы, а если его нет, название; по нему работа
+ищется в карте статусов.
+"""
+
+
+class HomeworkStates:
+    """Последние известные статусы работ, проиндексированные по ключу.
+
+    Ответ API сравнивается не целиком, а поэлементно: за один проход
+    находятся только те работы, статус которых изменился.
+    """
+
+    __slots__ = ('statuses', 'pending', 'names', 'unsent')
+
+    def __init__(self, statuses=None, unsent=()):
+        """Принимает статусы и уведомления, восстановленные из хранилища."""
+        self.statuses = {
+            key: sys.intern(status)
+            for key, status in dict(statuses or {}).items()
+        }
+        self.pending = None
+        self.names = None
+        self.unsent = tuple(unsent) or None
+
+    def __len__(self):
+        """Число известных работ."""
+        return len(self.statuses)
+
+    def has_status(self, status):
+        """Есть ли среди работ хотя бы одна с таким статусом."""
+        return status in self.statuses.values()
+
+    def diff(self, homeworks):
+        """Возвращает работы со сменившимся статусом, от старых к новым.
+
+        API отдаёт работы от свежих к старым, поэтому список
+        разворачивается, чтобы уведомления шли в порядке событий.
+        """
+        changed = []
+        seen = set()
+        for homework in homeworks:
+            if homework.key in seen:
+                continue
+            seen.add(homework.key)
+            if self.statuses.get(homework.key) != homework.status:
+                changed.append(homework)
+        changed.reverse()
+        return changed
+
+    def remember(self, homework):
+        """Запоминает статус работы после успешного уведомления."""
+        self.statuses[homework.key] = homework.status
+        if self.pending is None:
+            self.pending = {}
+        self.pending[homework.key] = homework.status
+        if homework.name != homework.key:
+            if self.names is None:
+                self.names = {}
+            self.names[homework.key] = homework.name
+
+    def take_unsent(self):
+        """Забирает уведомления, не отправленные до перезапуска."""
+        unsent, self.unsent = self.unsent, None
+        return unsent or ()
+
+    def name(self, key):
+        """Название работы, если оно известно, иначе её ключ.
+
+        Названия не сохраняются в хранилище: после перезапуска они
+        появляются снова со следующим изменением статуса.
+        """
+        return (self.names or {}).get(key, key)
+
+    def take_pending(self):
+        """Забирает статусы, изменившиеся с прошлой записи в хранилище."""
+        pending, self.pending = self.pending, None
+        return pending or {}
+
+
+class TenantState:
+    """Подписка: токен Практикума, чат для уведомлений и её состояние.
+
+    Хранит только то, что нужно боту между опросами; атрибуты
+    объявлены в __slots__, строки статусов общие с HOMEWORK_VERDICTS.
+    Ключ key считается один раз: по нему подписки ищутся постоянно.
+    Простаивающая подписка укладывается в TENANT_MEMORY_BUDGET байт,
+    см. memory_footprint().
+    """
+
+    __slots__ = (
+        'token', 'chat_id', 'key', 'timestamp', 'homeworks', 'alerts',
+        'idle_cycles', 'fingerprint', 'last_success', 'last_change',
+        'paused',
+    )
+
+    def __init__(self, token, chat_id):
+        """Курсор новой подписки — текущее время: о прошлом она молчит."""
+        self.token = token
+        self.chat_id = chat_id
+        self.key = tenant_key(token, chat_id)
+        self.timestamp = int(time.time())
+        self.homeworks = HomeworkStates()
+        self.alerts = None
+        self.idle_cycles = 0
+        self.fingerprint = None
+        self.last_success = self.timestamp
+        self.last_change = None
+        self.paused = False
+
+    @property
+    def headers(self):
+        """Заголовки запроса к API с токеном подписки."""
+        return {'Authorization': f'OAuth {self.token}'}
+
+    def record_poll(self, changes):
+        """Учитывает успешный опрос: считает опросы подряд без изменений.
+
+        last_change — последняя изменившаяся работа и время опроса,
+        в котором это обнаружено.
+        """
+        self.idle_cycles = 0 if changes else self.idle_cycles + 1
+        self.last_success = int(time.time())
+        if changes:
+            self.last_change = (changes[-1], self.last_success)
+
+    def __repr__(self):
+        """Подписка без токена: токен не должен попадать в логи."""
+        return f'TenantState(chat_id={self.chat_id!r})'
+
+
+def memory_footprint(obj, shared=()):
+    """Байты, занятые объектом и всем, на что он ссылается.
+
+    Не учитываются объекты из shared (например, общие строки
+    статусов), None, логические значения и малые целые числа,
+    которые интерпретатор не создаёт заново.
+    """
+    skip = {id(item) for item in shared}
+    stack = [obj]
+    total = 0
+    while stack:
+        item = stack.pop()
+        if (id(item) in skip or item is None or isinstance(item, bool)
+                or (isinstance(item, int) and -5 <= item <= 256)):
+            continue
+        skip.add(id(item))
+        total += sys.getsizeof(item)
+        if isinstance(item, dict):
+            stack.extend(item.keys())
+            stack.extend(item.values())
+        elif isinstance(item, (list, tuple, set, frozenset)):
+            stack.extend(item)
+        for slot in getattr(type(item), '__slots__', ()):
+            if hasattr(item, slot):
+                stack.append(getattr(item, slot))
+    return total
@@ -0,0 +1,170 @@
+"""Хранение курсора, статусов и неотправленных уведомлений в SQLite."""
+import logging
+import sqlite3
+import threading
+
+from state import Homework, HomeworkStates
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS tenants (
+    tenant_key TEXT PRIMARY KEY,
+    cursor INTEGER NOT NULL
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS statuses (
+    tenant_key TEXT NOT NULL,
+    homework_key TEXT NOT NULL,
+    status TEXT NOT NULL,
+    PRIMARY KEY (tenant_key, homework_key)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS unsent (
+    tenant_key TEXT NOT NULL,
+    homework_key TEXT NOT NULL,
+    name TEXT NOT NULL,
+    status TEXT NOT NULL,
+    PRIMARY KEY (tenant_key, homework_key)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS paused (
+    tenant_key TEXT PRIMARY KEY
+) WITHOUT ROWID;
+'''
+
+
+class StateStorage:
+    """Состояние подписок в SQLite в режиме WAL.
+
+    Изменения копятся в памяти через stage() и пишутся одной
+    транзакцией в flush(), поэтому запись на диск не зависит
+    от числа подписок, опрошенных за цикл.
+    """
+
+    def __init__(self, path):
+        """Открывает базу в режиме WAL и создаёт таблицы, если их нет."""
+        self.path = path
+        self.connection = sqlite3.connect(
+            path, check_same_thread=False, isolation_level=None)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+        self.connection.executescript(SCHEMA)
+        self._lock = threading.Lock()
+        self._cursors = {}
+        self._statuses = {}
+        self._unsent = {}
+        self._sent = []
+        self._paused = {}
+
+    def restore(self, tenant):
+        """Загружает курсор, статусы, уведомления и паузу подписки."""
+        with self._lock:
+            row = self.connection.execute(
+                'SELECT cursor FROM tenants WHERE tenant_key = ?',
+                (tenant.key,)
+            ).fetchone()
+            statuses = self.connection.execute(
+                'SELECT homework_key, status FROM statuses '
+                'WHERE tenant_key = ?',
+                (tenant.key,)
+            ).fetchall()
+            unsent = self.connection.execute(
+                'SELECT homework_key, name, status FROM unsent '
+                'WHERE tenant_key = ?',
+                (tenant.key,)
+            ).fetchall()
+            paused = self.connection.execute(
+                'SELECT 1 FROM paused WHERE tenant_key = ?',
+                (tenant.key,)
+            ).fetchone()
+        tenant.paused = paused is not None
+        if row is not None:
+            tenant.timestamp = row[0]
+        tenant.homeworks = HomeworkStates(
+            statuses, [Homework(*homework) for homework in unsent])
+        return row is not None
+
+    def stage(self, tenant):
+        """Откладывает запись состояния подписки до ближайшего flush()."""
+        pending = tenant.homeworks.take_pending()
+        with self._lock:
+            self._cursors[tenant.key] = tenant.timestamp
+            for homework, status in pending.items():
+                self._statuses[(tenant.key, homework)] = status
+
+    def stage_unsent(self, tenant_key, homework):
+        """Откладывает запись уведомления, которое ещё не отправлено."""
+        with self._lock:
+            self._unsent[(tenant_key, homework.key)] = homework
+
+    def stage_sent(self, receipts):
+        """Откладывает удаление отправленных уведомлений.
+
+        receipts — пары (ключ подписки, работа). Запись удаляется, только
+        если статус в ней тот же: более новое уведомление о той же работе
+        остаётся. Вызывается из любого потока.
+        """
+        with self._lock:
+            self._sent.extend(
+                (tenant_key, homework.key, homework.status)
+                for tenant_key, homework in receipts)
+
+    def stage_paused(self, tenant):
+        """Откладывает запись паузы подписки до ближайшего flush().
+
+        В отличие от stage() не трогает статусы, поэтому вызывается
+        из любого потока, например из обработчика команд.
+        """
+        with self._lock:
+            self._paused[tenant.key] = tenant.paused
+
+    def flush(self):
+        """Записывает все отложенные изменения одной транзакцией."""
+        with self._lock:
+            if not (self._cursors or self._statuses or self._unsent
+                    or self._sent or self._paused):
+                return
+            batch = (self._cursors, self._statuses, self._unsent,
+                     self._sent, self._paused)
+            self._cursors, self._statuses, self._unsent = {}, {}, {}
+            self._sent, self._paused = [], {}
+            try:
+                self.connection.execute('BEGIN')
+                self._write(*batch)
+                self.connection.execute('COMMIT')
+            except sqlite3.Error:
+                logger.exception('Не удалось сохранить состояние в '
+                                 f'{self.path}, запись будет повторена')
+                if self.connection.in_transaction:
+                    self.connection.execute('ROLLBACK')
+                (self._cursors, self._statuses, self._unsent,
+                 self._sent, self._paused) = batch
+
+    def _write(self, cursors, statuses, unsent, sent, paused):
+        self.connection.executemany(
+            'INSERT OR REPLACE INTO tenants VALUES (?, ?)', cursors.items())
+        self.connection.executemany(
+            'INSERT OR REPLACE INTO statuses VALUES (?, ?, ?)',
+            ((tenant, homework, status)
+             for (tenant, homework), status in statuses.items()))
+        self.connection.executemany(
+            'INSERT OR REPLACE INTO unsent VALUES (?, ?, ?, ?)',
+            ((tenant, *homework) for (tenant, _), homework in unsent.items()))
+        self.connection.executemany(
+            'DELETE FROM unsent '
+            'WHERE tenant_key = ? AND homework_key = ? AND status = ?',
+            sent)
+        self.connection.executemany(
+            'INSERT OR IGNORE INTO paused VALUES (?)',
+            ((tenant,) for tenant, on in paused.items() if on))
+        self.connection.executemany(
+            'DELETE FROM paused WHERE tenant_key = ?',
+            ((tenant,) for tenant, on in paused.items() if not on))
+
+    def save(self, tenant):
+        """Сразу сохраняет состояние одной подписки."""
+        self.stage(tenant)
+        self.flush()
+
+    def close(self):
+        """Сохраняет отложенные изменения и закрывает базу."""
+        self.flush()
+        self.connection.close()
@@ -0,0 +1,58 @@
+from alerts import AlertSuppressor, error_fingerprint
+
+
+def raise_error(error):
+    try:
+        raise error
+    except Exception as raised:
+        return raised
+
+
+class TestErrorFingerprint:
+    def test_message_details_ignored(self):
+        first = raise_error(ValueError('request 1 failed'))
+        second = raise_error(ValueError('request 2 failed'))
+        assert error_fingerprint(first) == error_fingerprint(second)
+
+    def test_type_distinguished(self):
+        assert error_fingerprint(raise_error(ValueError('x'))) != (
+            error_fingerprint(raise_error(KeyError('x'))))
+
+
+class TestAlertSuppressor:
+    def make(self):
+        self.now = 0
+        return AlertSuppressor(window=600, clock=lambda: self.now)
+
+    def test_repeats_suppressed(self):
+        alerts = self.make()
+        value_error = raise_error(ValueError('a'))
+        key_error = raise_error(KeyError('b'))
+        sent = []
+        for _ in range(5):
+            sent.append(alerts.check(value_error))
+            sent.append(alerts.check(key_error))
+            self.now += 60
+        assert len([message for message in sent if message]) == 2, (
+            'Чередующиеся ошибки должны сообщаться по одному разу.'
+        )
+
+    def test_summary_after_window(self):
+        alerts = self.make()
+        error = raise_error(ValueError('a'))
+        alerts.check(error)
+        messages = []
+        for _ in range(10):
+            self.now += 60
+            messages.append(alerts.check(error))
+        summaries = [message for message in messages if message]
+        assert len(summaries) == 1 and '(10 раз' in summaries[0], (
+            'Раз в окно должна приходить сводка с числом повторов.'
+        )
+
+    def test_resolved_error_reported_again(self):
+        alerts = self.make()
+        error = raise_error(ValueError('a'))
+        alerts.check(error)
+        self.now += 601
+        assert alerts.check(error) == 'Сбой в работе программы: a'
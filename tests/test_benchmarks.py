@@ -0,0 +1,30 @@
+import json
+import os
+import sys
+
+sys.path.append(os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'benchmarks'))
+
+import bench_pipeline  # noqa: E402
+import homework  # noqa: E402
+
+
+class TestBenchPipeline:
+    def test_report_on_local_stand_ins(self):
+        endpoint = homework.ENDPOINT
+        report = bench_pipeline.run_benchmark(tenants=3, cycles=2, workers=2)
+        assert report['cycles'] == 6, 'Каждая подписка опрашивается cycles раз.'
+        assert report['cycles_per_second'] > 0
+        assert report['p50_ms'] <= report['p99_ms']
+        assert homework.ENDPOINT == endpoint, (
+            'После прогона адрес API должен быть восстановлен.'
+        )
+
+    def test_regression_detected(self, tmp_path):
+        baseline = tmp_path / 'baseline.json'
+        baseline.write_text(json.dumps(
+            {'cycles_per_second': 100, 'p50_ms': 10, 'p99_ms': 50}))
+        report = {'cycles_per_second': 70, 'p50_ms': 11, 'p99_ms': 80}
+        assert bench_pipeline.check_regression(report, baseline, 0.2) == [
+            'cycles_per_second', 'p99_ms'
+        ]
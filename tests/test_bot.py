@@ -4,12 +4,18 @@ import re
 import time
 from http import HTTPStatus
 
+import http_client
 import pytest
 import requests
 import telegram
 import utils
 
 
+def api_session():
+    """Сессия общего HTTP-клиента, через которую бот ходит в API."""
+    return http_client.get_client().session
+
+
 def create_mock_response_get_with_custom_status_and_data(random_timestamp,
                                                          http_status,
                                                          data):
@@ -191,7 +197,7 @@ class TestHomework:
                     'Проверьте, что в параметре `from_date` передано число.'
                 )
 
-        monkeypatch.setattr(requests, 'get', check_request_get_call)
+        monkeypatch.setattr(api_session(), 'get', check_request_get_call)
         try:
             homework_module.get_api_answer(current_timestamp)
         except AssertionError as e:
@@ -214,7 +220,7 @@ class TestHomework:
                 current_timestamp=current_timestamp, **kwargs
             )
 
-        monkeypatch.setattr(requests, 'get', mock_response_get)
+        monkeypatch.setattr(api_session(), 'get', mock_response_get)
 
         result = homework_module.get_api_answer(current_timestamp)
         assert isinstance(result, dict), (
@@ -234,7 +240,7 @@ class TestHomework:
             self.HOMEWORK_FUNC_WITH_PARAMS_QTY[func_name]
         )
 
-        monkeypatch.setattr(requests, 'get', response)
+        monkeypatch.setattr(api_session(), 'get', response)
         try:
             homework_module.get_api_answer(current_timestamp)
         except Exception:
@@ -258,7 +264,7 @@ class TestHomework:
         def mock_request_get_with_exception(*args, **kwargs):
             raise requests.RequestException('Something wrong')
 
-        monkeypatch.setattr(requests, 'get', mock_request_get_with_exception)
+        monkeypatch.setattr(api_session(), 'get', mock_request_get_with_exception)
         try:
             homework_module.get_api_answer(current_timestamp)
         except requests.RequestException:
@@ -586,7 +592,7 @@ class TestHomework:
                 current_timestamp=current_timestamp, **kwargs
             )
 
-        monkeypatch.setattr(requests, 'get', mock_response_get)
+        monkeypatch.setattr(api_session(), 'get', mock_response_get)
 
     def test_main_without_env_vars_raise_exception(
             self, caplog, monkeypatch, random_timestamp, current_timestamp,
@@ -723,7 +729,7 @@ class TestHomework:
                 data=data_with_new_hw_status
             ))
         monkeypatch.setattr(
-            requests,
+            api_session(),
             'get',
             mock_response_get_with_new_status
         )
@@ -0,0 +1,122 @@
+from types import SimpleNamespace
+
+import commands
+from state import Homework, TenantState
+from storage import StateStorage
+
+VERDICTS = {'approved': 'Зачтено', 'rejected': 'Есть замечания'}
+
+
+def make_commands(tenant, now=1000):
+    return commands.Commands([tenant], VERDICTS, clock=lambda: now)
+
+
+def update(update_id, chat_id, text):
+    return SimpleNamespace(
+        update_id=update_id,
+        message=SimpleNamespace(chat_id=chat_id, text=text))
+
+
+class FakeBot:
+    def __init__(self, batches):
+        self.batches = batches
+        self.offsets = []
+
+    def get_updates(self, offset=None, timeout=0, allowed_updates=None):
+        self.offsets.append(offset)
+        batch = self.batches.pop(0)
+        if isinstance(batch, Exception):
+            raise batch
+        return batch
+
+
+class TestCommands:
+    def test_status_from_cached_state(self):
+        tenant = TenantState('token', 42)
+        tenant.homeworks.remember(Homework('1', 'hw1.zip', 'approved'))
+        tenant.last_success = 1000 - 300
+        answer = make_commands(tenant).handle(42, '/status')
+        assert '"hw1.zip": Зачтено' in answer, (
+            'Статус должен браться из состояния бота, без запроса к API.'
+        )
+        assert '5 мин назад' in answer
+
+    def test_last_change(self):
+        tenant = TenantState('token', 42)
+        handler = make_commands(tenant, now=tenant.last_success)
+        assert 'не менялись' in handler.handle(42, '/last')
+        tenant.record_poll([Homework('1', 'hw1.zip', 'rejected')])
+        assert '"hw1.zip": Есть замечания' in handler.handle(42, '/last')
+
+    def test_pause_and_resume(self):
+        tenant = TenantState('token', 42)
+        handler = make_commands(tenant)
+        handler.handle(42, '/pause@homework_bot')
+        assert tenant.paused
+        assert 'приостановлен' in handler.handle(42, '/status')
+        handler.handle(42, '/resume')
+        assert not tenant.paused
+
+    def test_chat_with_several_subscriptions(self):
+        tenants = [TenantState('first', 42), TenantState('second', 42)]
+        tenants[0].homeworks.remember(Homework('1', 'hw1.zip', 'approved'))
+        tenants[1].homeworks.remember(Homework('2', 'hw2.zip', 'rejected'))
+        tenants[1].record_poll([Homework('2', 'hw2.zip', 'rejected')])
+        handler = commands.Commands(tenants, VERDICTS, clock=lambda: 1000)
+        status = handler.handle(42, '/status')
+        assert '"hw1.zip"' in status and '"hw2.zip"' in status, (
+            '/status должен показывать все подписки чата.'
+        )
+        assert '"hw2.zip"' in handler.handle(42, '/last')
+        handler.handle(42, '/pause')
+        assert all(tenant.paused for tenant in tenants), (
+            '/pause должен приостанавливать все подписки чата.'
+        )
+
+    def test_pause_survives_restart(self, tmp_path):
+        path = tmp_path / 'state.sqlite3'
+        storage = StateStorage(path)
+        tenant = TenantState('token', 42)
+        commands.Commands([tenant], VERDICTS, storage=storage).handle(
+            42, '/pause')
+        storage.close()
+        restored = TenantState('token', 42)
+        StateStorage(path).restore(restored)
+        assert restored.paused, 'Пауза должна сохраняться в хранилище.'
+
+    def test_other_chats_and_plain_text_ignored(self):
+        handler = make_commands(TenantState('token', 42))
+        assert handler.handle(7, '/status') is None, (
+            'Команды из чатов без подписки не должны получать ответ.'
+        )
+        assert handler.handle(42, 'привет') is None
+        assert handler.handle(42, '/unknown') == commands.HELP
+
+
+class TestCommandListener:
+    def test_replies_and_advances_offset(self):
+        bot = FakeBot([
+            [update(10, 42, '/help'), update(11, 7, '/help')],
+            [],
+        ])
+        replies = []
+        listener = commands.CommandListener(
+            bot, make_commands(TenantState('token', 42)),
+            lambda chat_id, text: replies.append((chat_id, text)))
+        listener.poll()
+        listener.poll()
+        assert replies == [(42, commands.HELP)]
+        assert bot.offsets == [None, 12], (
+            'Полученные обновления должны подтверждаться через offset.'
+        )
+
+    def test_errors_do_not_stop_listener(self):
+        bot = FakeBot([ConnectionError('down'), [update(1, 42, '/help')]])
+        replies = []
+        listener = commands.CommandListener(
+            bot, make_commands(TenantState('token', 42)),
+            lambda chat_id, text: (replies.append(text), listener.stop()),
+            retry_delay=0)
+        listener.start()
+        listener._thread.join(5)
+        assert replies == [commands.HELP]
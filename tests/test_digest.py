@@ -0,0 +1,61 @@
+import asyncio
+
+from digest import DigestBuffer
+from state import Homework
+
+
+class ListOutbox:
+    def __init__(self):
+        self.sent = []
+
+    def put(self, chat_id, text, receipts=None):
+        self.sent.append((chat_id, text))
+
+
+def names(homeworks):
+    return ','.join(f'{hw.name}={hw.status}' for hw in homeworks)
+
+
+class TestDigestBuffer:
+    def test_changes_within_window_coalesced(self):
+        outbox = ListOutbox()
+
+        async def run():
+            digests = DigestBuffer(outbox, names, window=0.05)
+            digests.add(1, Homework('1', 'hw1', 'reviewing'))
+            digests.add(2, Homework('3', 'hw3', 'approved'))
+            digests.add(1, Homework('2', 'hw2', 'rejected'))
+            digests.add(1, Homework('1', 'hw1', 'approved'))
+            assert outbox.sent == []
+            await asyncio.sleep(0.1)
+
+        asyncio.run(run())
+        assert sorted(outbox.sent) == [
+            (1, 'hw2=rejected,hw1=approved'), (2, 'hw3=approved')
+        ], 'Изменения чата за окно должны прийти одной сводкой.'
+
+    def test_zero_window_sends_immediately(self):
+        outbox = ListOutbox()
+
+        async def run():
+            digests = DigestBuffer(outbox, names, window=0)
+            digests.add(1, Homework('1', 'hw1', 'approved'))
+
+        asyncio.run(run())
+        assert outbox.sent == [(1, 'hw1=approved')]
+
+
+class TestFormatDigest:
+    def test_single_change_uses_parse_status(self, homework_module):
+        homework = Homework('1', 'hw1', 'approved')
+        assert homework_module.format_digest([homework]) == (
+            homework_module.parse_status(homework))
+
+    def test_digest_uses_verdicts(self, homework_module):
+        message = homework_module.format_digest([
+            Homework('1', 'hw1', 'approved'),
+            Homework('2', 'hw2', 'rejected'),
+        ])
+        verdicts = homework_module.HOMEWORK_VERDICTS
+        assert verdicts['approved'] in message
+        assert verdicts['rejected'] in message
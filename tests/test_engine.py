@@ -0,0 +1,326 @@
+import asyncio
+import functools
+import json
+import os
+import signal
+import time
+
+from telegram.error import RetryAfter
+
+import engine
+from exceptions import BudgetExceeded, StatusCodeError
+from state import Homework, TenantState
+from storage import StateStorage
+
+
+class FakeBot:
+    def __init__(self):
+        self.sent = []
+
+    def send_message(self, chat_id, text):
+        self.sent.append((chat_id, text))
+
+
+class FakeResponse:
+    def __init__(self, data):
+        self.content = json.dumps(data).encode()
+        self.decoded = 0
+
+    def json(self):
+        self.decoded += 1
+        return json.loads(self.content)
+
+
+def make_pipeline(answers):
+    def fetch(headers, timestamp):
+        answer = answers.pop(0)
+        if isinstance(answer, Exception):
+            raise answer
+        if isinstance(answer, FakeResponse):
+            return answer
+        return FakeResponse(answer)
+
+    def check(response):
+        return [
+            Homework(str(hw.get('id', hw['homework_name'])),
+                     hw['homework_name'], hw['status'])
+            for hw in response['homeworks']
+        ]
+
+    def digest(homeworks):
+        return ', '.join(f'{hw.name}: {hw.status}' for hw in homeworks)
+
+    return engine.Pipeline(fetch=fetch, check=check, digest=digest)
+
+
+class TestPollingEngine:
+    HOMEWORK = {'homework_name': 'hw1', 'status': 'approved'}
+
+    def poll(self, answers, tenant, times=1, alert_chat_id=None):
+        bot = FakeBot()
+        polling = engine.PollingEngine(
+            bot, [tenant], make_pipeline(answers), period=600,
+            alert_chat_id=alert_chat_id)
+
+        async def cycle():
+            for _ in range(times):
+                await polling.poll(tenant)
+            polling.digests.flush_all()
+            await polling.outbox.drain(timeout=5)
+            await polling.outbox.stop()
+
+        asyncio.run(cycle())
+        return bot.sent
+
+    def test_new_status_sent_to_tenant_chat(self):
+        tenant = TenantState('token', 42)
+        answers = [{'homeworks': [self.HOMEWORK], 'current_date': 1}] * 2
+        sent = self.poll(answers, tenant, times=2)
+        assert sent == [(42, 'hw1: approved')], (
+            'Новый статус должен уходить в чат подписки ровно один раз.'
+        )
+
+    def test_repeated_error_sent_once(self):
+        tenant = TenantState('token', 42)
+        answers = [ValueError('boom'), ValueError('boom')]
+        sent = self.poll(answers, tenant, times=2)
+        assert len(sent) == 1 and 'boom' in sent[0][1], (
+            'Одинаковая ошибка должна сообщаться в чат один раз.'
+        )
+
+    def test_phase_within_period(self):
+        polling = engine.PollingEngine(
+            FakeBot(), [], make_pipeline([]), period=600)
+        phases = {polling.phase(TenantState(f't{chat}', chat))
+                  for chat in range(50)}
+        assert all(0 <= phase < 600 for phase in phases)
+        assert len(phases) > 1, 'Опросы подписок должны быть разнесены.'
+        assert polling.phase(TenantState('t', 1)) == polling.phase(
+            TenantState('t', 2)), 'Чаты одного токена опрашиваются вместе.'
+
+    def test_load_tenants(self, tmp_path):
+        path = tmp_path / 'tenants.json'
+        path.write_text(json.dumps([
+            {'practicum_token': 'a', 'chat_id': 1},
+            {'practicum_token': 'b', 'chat_id': 2},
+        ]))
+        tenants = engine.load_tenants(path)
+        assert [tenant.chat_id for tenant in tenants] == [1, 2]
+        assert tenants[0].headers == {'Authorization': 'OAuth a'}
+
+    def test_cursor_follows_current_date(self):
+        tenant = TenantState('token', 42)
+        tenant.timestamp = 100
+        self.poll([{'homeworks': [], 'current_date': 250}], tenant)
+        assert tenant.timestamp == 250, (
+            'Следующий запрос должен начинаться с `current_date` из ответа.'
+        )
+
+    def test_cursor_kept_on_error(self):
+        tenant = TenantState('token', 42)
+        tenant.timestamp = 100
+        self.poll([ValueError('boom')], tenant)
+        assert tenant.timestamp == 100
+
+    def test_each_changed_homework_reported(self):
+        tenant = TenantState('token', 42)
+        answer = {
+            'homeworks': [
+                {'id': 2, 'homework_name': 'hw2', 'status': 'reviewing'},
+                {'id': 1, 'homework_name': 'hw1', 'status': 'approved'},
+            ],
+            'current_date': 1,
+        }
+        sent = self.poll([answer], tenant)
+        assert [message for _, message in sent] == [
+            'hw1: approved, hw2: reviewing'
+        ], 'Изменения одного опроса должны прийти одной сводкой.'
+
+    def test_sigterm_sends_pending_digest_and_exits(self):
+        tenant = TenantState('token', 42)
+        bot = FakeBot()
+        polling = engine.PollingEngine(
+            bot, [tenant],
+            make_pipeline([{'homeworks': [self.HOMEWORK], 'current_date': 1}]),
+            period=600, shutdown_timeout=5)
+        polling.phase = lambda tenant: 0
+
+        async def scenario():
+            task = asyncio.ensure_future(polling.run(handle_signals=True))
+            while tenant.last_change is None:
+                await asyncio.sleep(0.01)
+            os.kill(os.getpid(), signal.SIGTERM)
+            await asyncio.wait_for(task, 5)
+
+        started = time.monotonic()
+        asyncio.run(scenario())
+        assert time.monotonic() - started < 3, (
+            'После SIGTERM движок должен останавливаться за секунды.'
+        )
+        assert bot.sent == [(42, 'hw1: approved')], (
+            'Сводка, ждущая окна, должна уйти до остановки.'
+        )
+
+    def test_unchanged_body_not_decoded(self):
+        tenant = TenantState('token', 42)
+        tenant.timestamp = 0
+        first = FakeResponse({'homeworks': [self.HOMEWORK], 'current_date': 5})
+        second = FakeResponse({'homeworks': [self.HOMEWORK], 'current_date': 9})
+        sent = self.poll([first, second], tenant, times=2)
+        assert second.decoded == 0, (
+            'Ответ, совпадающий с предыдущим, не нужно разбирать заново.'
+        )
+        assert tenant.timestamp == 9, 'Курсор всё равно должен сдвигаться.'
+        assert len(sent) == 1
+
+    def test_upstream_errors_go_to_alert_chat(self, monkeypatch):
+        monkeypatch.setattr(engine, 'call_with_retries', functools.partial(
+            engine.call_with_retries, attempts=1))
+        tenants = [TenantState('token', chat) for chat in (1, 2)]
+        sent = []
+        for tenant in tenants:
+            sent += self.poll([StatusCodeError('502', 502)], tenant,
+                              alert_chat_id=99)
+        assert sent and all(chat == 99 for chat, _ in sent), (
+            'Сбои API не должны рассылаться по чатам всех подписок.'
+        )
+
+    def test_poll_deferred_until_budget_allows(self):
+        tenant = TenantState('token', 42)
+        tenant.timestamp = 0
+        delays = [0.05, 0]
+        pipeline = make_pipeline([{'homeworks': [], 'current_date': 1}])
+        polling = engine.PollingEngine(
+            FakeBot(), [tenant],
+            pipeline._replace(delay=lambda headers: delays.pop(0)),
+            period=600)
+
+        async def cycle():
+            started = asyncio.get_running_loop().time()
+            await polling.poll(tenant)
+            return asyncio.get_running_loop().time() - started
+
+        assert asyncio.run(cycle()) >= 0.05, (
+            'Опрос сверх лимита запросов должен откладываться, а не падать.'
+        )
+        assert tenant.timestamp == 1 and delays == []
+
+    def test_budget_refusal_is_not_an_api_failure(self):
+        tenant = TenantState('token', 42)
+        sent = self.poll([BudgetExceeded('limit', 1)], tenant)
+        assert sent == [], 'Отказ по лимиту не должен сообщаться в чат.'
+
+    def test_same_token_chats_share_one_request(self):
+        tenants = [TenantState('token', chat) for chat in (1, 2, 3)]
+        for tenant in tenants:
+            tenant.timestamp = 0
+        bot = FakeBot()
+        requests = []
+        answer = {'homeworks': [self.HOMEWORK], 'current_date': 5}
+
+        def fetch(headers, timestamp):
+            requests.append(timestamp)
+            time.sleep(0.05)
+            return FakeResponse(answer)
+
+        polling = engine.PollingEngine(
+            bot, tenants, make_pipeline([])._replace(fetch=fetch), period=600)
+
+        async def cycle():
+            await asyncio.gather(*(polling.poll(tenant) for tenant in tenants))
+            polling.digests.flush_all()
+            await polling.outbox.drain(timeout=5)
+            await polling.outbox.stop()
+
+        asyncio.run(cycle())
+        assert requests == [0], (
+            'Одновременные опросы с одним токеном и курсором должны '
+            'делить один запрос.'
+        )
+        assert sorted(bot.sent) == [(chat, 'hw1: approved')
+                                    for chat in (1, 2, 3)], (
+            'Ответ должен дойти до каждого чата подписки.'
+        )
+        assert all(tenant.timestamp == 5 for tenant in tenants)
+
+    def test_digest_pending_at_crash_sent_after_restart(self, tmp_path):
+        path = tmp_path / 'state.sqlite3'
+        tenant = TenantState('token', 42)
+        storage = StateStorage(path)
+        crashed = engine.PollingEngine(
+            FakeBot(), [tenant],
+            make_pipeline([{'homeworks': [self.HOMEWORK], 'current_date': 1}]),
+            period=600, storage=storage)
+        crashed.digests.window = 600
+
+        async def crash():
+            await crashed.poll(tenant)
+            storage.flush()
+            await crashed.outbox.stop()
+
+        asyncio.run(crash())
+        bot = FakeBot()
+        storage = StateStorage(path)
+        restarted = engine.PollingEngine(
+            bot, [TenantState('token', 42)], make_pipeline([]), period=600,
+            storage=storage, shutdown_timeout=5)
+        restarted.phase = lambda tenant: 600
+
+        async def scenario():
+            running = asyncio.ensure_future(restarted.run())
+            await asyncio.sleep(0.1)
+            restarted.stop()
+            await asyncio.wait_for(running, 5)
+
+        asyncio.run(scenario())
+        assert bot.sent == [(42, 'hw1: approved')], (
+            'Сводка, не ушедшая до падения, должна прийти после перезапуска.'
+        )
+        assert storage.connection.execute(
+            'SELECT COUNT(*) FROM unsent').fetchone()[0] == 0
+
+    def test_undelivered_digest_kept_after_shutdown(self, tmp_path):
+        path = tmp_path / 'state.sqlite3'
+        storage = StateStorage(path)
+        tenant = TenantState('token', 42)
+
+        class SlowBot:
+            def send_message(self, chat_id, text):
+                raise RetryAfter(60)
+
+        polling = engine.PollingEngine(
+            SlowBot(), [tenant],
+            make_pipeline([{'homeworks': [self.HOMEWORK], 'current_date': 1}]),
+            period=600, storage=storage, shutdown_timeout=0.5)
+        polling.phase = lambda tenant: 0
+
+        async def scenario():
+            running = asyncio.ensure_future(polling.run())
+            while tenant.last_change is None:
+                await asyncio.sleep(0.01)
+            polling.stop()
+            await asyncio.wait_for(running, 5)
+
+        asyncio.run(scenario())
+        restored = TenantState('token', 42)
+        StateStorage(path).restore(restored)
+        assert restored.homeworks.take_unsent() == (
+            Homework('hw1', 'hw1', 'approved'),
+        ), 'Сводка, которую Telegram не принял до остановки, не теряется.'
+
+    def test_removal_does_not_scan_tenants(self):
+        tenants = [TenantState('token', chat) for chat in range(20000)]
+        polling = engine.PollingEngine(
+            FakeBot(), tenants, make_pipeline([]), period=600)
+        removed = {tenant.key for tenant in tenants[::10]}
+        started = time.monotonic()
+        for key in removed:
+            assert polling.remove_tenant(key).key == key
+        assert time.monotonic() - started < 1, (
+            'Снятие подписки не должно перебирать все подписки.'
+        )
+        assert polling.remove_tenant(next(iter(removed))) is None
+        assert {tenant.key for tenant in polling.tenants} == (
+            {tenant.key for tenant in tenants} - removed)
+        polling.add_tenant(tenants[0])
+        assert polling.remove_tenant(tenants[0].key) is tenants[0]
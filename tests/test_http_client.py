@@ -0,0 +1,117 @@
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import requests
+
+import http_client
+from exceptions import BudgetExceeded
+from ratelimit import RequestBudget
+
+
+class KeepAliveHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        body = str(self.client_address[1]).encode()
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), KeepAliveHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f'http://127.0.0.1:{server.server_address[1]}/'
+    server.shutdown()
+    server.server_close()
+
+
+class TestHttpClient:
+    def test_timeout_passed_by_default(self, monkeypatch):
+        calls = []
+        client = http_client.HttpClient(connect_timeout=1, read_timeout=2)
+        adapter = client.session.get_adapter('https://example.com')
+
+        def send(request, **kwargs):
+            calls.append(kwargs)
+            raise requests.ConnectionError('нет сети')
+
+        monkeypatch.setattr(adapter, 'send', send)
+        with pytest.raises(requests.ConnectionError):
+            client.get('https://example.com', params={'from_date': 0})
+        assert calls[0]['timeout'] == (1, 2), (
+            'Каждый запрос должен уходить с таймаутами подключения и чтения.'
+        )
+
+    def test_pool_is_sized(self):
+        client = http_client.HttpClient(pool_maxsize=7)
+        adapter = client.session.get_adapter('https://practicum.yandex.ru')
+        assert adapter._pool_maxsize == 7
+        assert adapter.max_retries.total == 0
+
+    def test_connection_reused(self, server):
+        client = http_client.HttpClient()
+        ports = {client.get(server).text for _ in range(3)}
+        client.close()
+        assert len(ports) == 1, (
+            'Запросы должны идти через одно keep-alive соединение пула.'
+        )
+
+    def test_client_is_shared(self):
+        assert http_client.get_client() is http_client.get_client()
+
+
+class TestRequestBudget:
+    def test_token_limit_is_per_token(self):
+        now = [0]
+        budget = RequestBudget(token_rate=0.5, token_burst=1,
+                               clock=lambda: now[0])
+        assert budget.acquire('OAuth a') == 0
+        assert budget.acquire('OAuth a') == 2, (
+            'Второй запрос с тем же токеном должен ждать пополнения ведра.'
+        )
+        assert budget.acquire('OAuth b') == 0, (
+            'Лимит одного токена не должен задерживать другие токены.'
+        )
+        now[0] = 2
+        assert budget.delay('OAuth a') == 0
+
+    def test_global_limit_covers_all_tokens(self):
+        now = [0]
+        budget = RequestBudget(global_rate=1, global_burst=2,
+                               clock=lambda: now[0])
+        assert [budget.acquire(f'OAuth {n}') for n in range(3)] == [0, 0, 1]
+
+    def test_rejected_request_not_counted(self):
+        budget = RequestBudget(token_rate=1, token_burst=1, global_rate=10,
+                               clock=lambda: 0)
+        budget.acquire('OAuth a')
+        budget.acquire('OAuth a')
+        assert budget.total.tokens == 9, (
+            'Запрос сверх лимита токена не должен расходовать общий лимит.'
+        )
+
+    def test_no_limits(self):
+        assert RequestBudget().acquire('OAuth a') == 0
+        assert http_client.HttpClient().delay({'Authorization': 'a'}) == 0
+
+    def test_client_refuses_over_budget(self, monkeypatch):
+        calls = []
+        client = http_client.HttpClient(budget=RequestBudget(
+            token_rate=0.01, token_burst=1))
+        monkeypatch.setattr(
+            client.session, 'get', lambda url, **kwargs: calls.append(url))
+        headers = {'Authorization': 'OAuth a'}
+        client.get('https://example.com', headers=headers)
+        with pytest.raises(BudgetExceeded) as error:
+            client.get('https://example.com', headers=headers)
+        assert len(calls) == 1, 'Запрос сверх лимита не должен уходить в API.'
+        assert error.value.retry_after > 0
+        assert client.delay(headers) > 0
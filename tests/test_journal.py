@@ -0,0 +1,145 @@
+import gzip
+import json
+import multiprocessing
+
+import homework
+import http_client
+import journal
+
+
+def answer(status):
+    return json.dumps({
+        'homeworks': [{'id': 1, 'homework_name': 'hw1', 'status': status}],
+        'current_date': 1,
+    }).encode()
+
+
+def entry(body, status=200, tenant='a'):
+    return journal.JournalRecord(0, tenant, 0, status, body)
+
+
+def write_as_worker(node, count):
+    journal.use_worker_file(node)
+    writer = journal.get_journal()
+    for from_date in range(count):
+        writer.record({}, from_date, 200, answer('approved') * 50)
+    writer.close()
+
+
+class TestJournal:
+    def test_records_round_trip(self, tmp_path):
+        path = tmp_path / 'journal.jsonl.gz'
+        writer = journal.Journal(path)
+        headers = {'Authorization': 'OAuth secret'}
+        writer.record(headers, 10, 200, answer('approved'))
+        writer.record(headers, 20, 502, b'\xff\xfe')
+        writer.close()
+        records = list(journal.read_journal(path))
+        assert [(r.from_date, r.status, r.body) for r in records] == [
+            (10, 200, answer('approved')), (20, 502, b'\xff\xfe'),
+        ], 'Журнал должен возвращать тела ответов байт в байт.'
+        assert b'secret' not in gzip.decompress(path.read_bytes()), (
+            'Токен не должен попадать в журнал.'
+        )
+
+    def test_journal_is_appended(self, tmp_path):
+        path = tmp_path / 'journal.jsonl.gz'
+        for from_date in (1, 2):
+            writer = journal.Journal(path)
+            writer.record({}, from_date, 200, b'{}')
+            writer.close()
+        assert [r.from_date for r in journal.read_journal(path)] == [1, 2]
+
+    def test_truncated_journal_read_until_break(self, tmp_path):
+        path = tmp_path / 'journal.jsonl.gz'
+        writer = journal.Journal(path)
+        for from_date in range(100):
+            writer.record({}, from_date, 200, b'{}')
+        writer.close()
+        complete = path.read_bytes()
+        path.write_bytes(complete + gzip.compress(b'{"time": 1')[:-6])
+        assert len(list(journal.read_journal(path))) == 100
+
+    def test_full_queue_drops_records(self, tmp_path):
+        path = tmp_path / 'journal.jsonl.gz'
+        writer = journal.Journal(path, queue_size=1)
+        writer._queue.put(None)
+        writer._thread.join()
+        writer.record({}, 1, 200, b'{}')
+        writer.record({}, 2, 200, b'{}')
+        assert writer.dropped == 1 and writer._queue.qsize() == 1, (
+            'Очередь журнала не должна расти, если запись не успевает.'
+        )
+
+    def test_unwritable_file_disables_journal(self, monkeypatch, tmp_path):
+        path = tmp_path / 'missing' / 'journal.jsonl.gz'
+        monkeypatch.setattr(journal, 'JOURNAL_FILE', str(path))
+        monkeypatch.setattr(journal, '_journal', None)
+        assert journal.get_journal() is None
+        assert journal.JOURNAL_FILE is None, (
+            'Журнал, файл которого не открылся, должен отключаться.'
+        )
+
+    def test_request_api_journals_response(self, monkeypatch, tmp_path):
+        writer = journal.Journal(tmp_path / 'journal.jsonl.gz')
+        monkeypatch.setattr(journal, '_journal', writer)
+
+        class Response:
+            status_code = 200
+            content = answer('reviewing')
+
+        monkeypatch.setattr(
+            http_client.get_client(), 'get',
+            lambda *args, **kwargs: Response())
+        homework.request_api({'Authorization': 'OAuth t'}, 5)
+        writer.close()
+        [record] = journal.read_journal(writer.path)
+        assert record.from_date == 5 and record.body == answer('reviewing')
+
+
+    def test_each_worker_writes_own_file(self, monkeypatch, tmp_path):
+        path = tmp_path / 'journal.jsonl.gz'
+        monkeypatch.setenv('JOURNAL_FILE', str(path))
+        context = multiprocessing.get_context('spawn')
+        workers = [
+            context.Process(target=write_as_worker, args=(node, 2000))
+            for node in ('worker-1', 'worker-2', 'worker-3')
+        ]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join(30)
+        assert [worker.exitcode for worker in workers] == [0, 0, 0]
+        files = sorted(tmp_path.iterdir())
+        assert [file.name for file in files] == [
+            f'journal.jsonl.gz.worker-{number}' for number in (1, 2, 3)
+        ], 'У каждого воркера должен быть свой файл журнала.'
+        records = list(journal.read_journals(files))
+        assert len(records) == 6000, (
+            'Журналы воркеров должны читаться целиком.'
+        )
+        assert [r.time for r in records] == sorted(r.time for r in records)
+
+
+class TestReplay:
+    def test_replay_counts_pipeline_results(self):
+        records = [
+            entry(answer('reviewing')),
+            entry(answer('reviewing')),
+            entry(answer('approved')),
+            entry(answer('reviewing'), tenant='b'),
+            entry(b'<html>', status=502),
+            entry(b'{"homeworks": 1}'),
+            entry(b'not json'),
+        ]
+        messages = []
+        summary = journal.replay(
+            records, homework.check_response, messages.append)
+        assert summary['records'] == 7
+        assert summary['messages'] == 3, (
+            'Статусы должны сравниваться отдельно для каждой подписки.'
+        )
+        assert summary['status_errors'] == 1
+        assert summary['invalid'] == 2
+        assert summary['tenants'] == 2
+        assert len(messages) == 3
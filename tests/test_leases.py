@@ -0,0 +1,171 @@
+import asyncio
+import json
+
+import engine
+import leases
+from state import TenantState
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class FakeBot:
+    def send_message(self, chat_id, text):
+        pass
+
+
+class Response:
+    content = json.dumps({'homeworks': [], 'current_date': 1}).encode()
+
+    def json(self):
+        return json.loads(self.content)
+
+
+class TestLeaseStore:
+    def stores(self, tmp_path, clock):
+        path = tmp_path / 'leases.sqlite3'
+        return (leases.LeaseStore(path, 'a', ttl=30, clock=clock),
+                leases.LeaseStore(path, 'b', ttl=30, clock=clock))
+
+    def test_lease_held_by_one_node(self, tmp_path):
+        clock = Clock()
+        first, second = self.stores(tmp_path, clock)
+        assert first.claim(['t1', 't2'], limit=5) == ['t1', 't2']
+        assert second.claim(['t1', 't2', 't3'], limit=5) == ['t3'], (
+            'Действующую аренду не может захватить другой узел.'
+        )
+        clock.now += 20
+        assert first.renew() == ({'t1', 't2'}, 1)
+        clock.now += 20
+        assert second.claim(['t1', 't2'], limit=5) == [], (
+            'Продлённая аренда не должна считаться просроченной.'
+        )
+
+    def test_expired_lease_is_stolen(self, tmp_path):
+        clock = Clock()
+        first, second = self.stores(tmp_path, clock)
+        first.claim(['t1'], limit=1)
+        clock.now += 31
+        assert second.claim(['t1'], limit=1) == ['t1'], (
+            'Аренду упавшего узла должен забрать другой после срока.'
+        )
+        assert first.renew()[0] == set(), (
+            'Узел не должен продлевать аренду, которую уже забрали.'
+        )
+
+    def test_released_lease_claimed_at_once(self, tmp_path):
+        clock = Clock()
+        first, second = self.stores(tmp_path, clock)
+        first.claim(['t1', 't2'], limit=2)
+        first.release(['t2'])
+        assert second.claim(['t1', 't2'], limit=2) == ['t2']
+        first.release_all()
+        assert second.claim(['t1'], limit=1) == ['t1']
+
+    def test_live_nodes_counted(self, tmp_path):
+        clock = Clock()
+        first, second = self.stores(tmp_path, clock)
+        first.renew()
+        assert second.renew()[1] == 2
+        clock.now += 31
+        assert second.renew()[1] == 1, (
+            'Узел, давно не продлевавший аренды, не должен считаться живым.'
+        )
+
+    def test_standby_takes_over_with_stored_state(self, tmp_path):
+        clock = Clock()
+        first, second = self.stores(tmp_path, clock)
+        acquired = []
+        active = leases.TenantLease(first, 'key')
+        standby = leases.TenantLease(second, 'key',
+                                     lambda: acquired.append(True))
+        assert active.hold()
+        assert active.extend(600)
+        clock.now += 600
+        assert not standby.hold(), (
+            'Аренда продлевается на всю паузу до следующего опроса.'
+        )
+        clock.now += 31
+        assert standby.hold() and acquired == [True], (
+            'Резервный узел после захвата должен перечитать состояние.'
+        )
+        assert not active.hold()
+
+
+class TestLeaseCoordinator:
+    def make_engine(self, path, node_id, tenants, polls):
+        def fetch(headers, timestamp):
+            polls.append((node_id, headers['Authorization']))
+            return Response()
+
+        pipeline = engine.Pipeline(
+            fetch=fetch, check=lambda answer: [], digest=str)
+        polling = engine.PollingEngine(
+            FakeBot(), tenants, pipeline, period=600,
+            leases=leases.LeaseStore(path, node_id, ttl=0.6),
+            shutdown_timeout=1)
+        polling.phase = lambda tenant: 0
+        return polling
+
+    def test_nodes_split_tenants_and_fail_over(self, tmp_path):
+        path = tmp_path / 'leases.sqlite3'
+        polls = []
+        first = self.make_engine(
+            path, 'a', [TenantState(f'token{n}', n) for n in range(6)], polls)
+        second = self.make_engine(
+            path, 'b', [TenantState(f'token{n}', n) for n in range(6)], polls)
+
+        def keys(polling):
+            return {tenant.key for tenant in polling.tenants}
+
+        async def scenario():
+            running = asyncio.ensure_future(first.run())
+            await asyncio.sleep(0.3)
+            assert len(keys(first)) == 6, 'Один узел опрашивает все подписки.'
+            standby = asyncio.ensure_future(second.run())
+            await asyncio.sleep(1)
+            assert len(keys(first)) == len(keys(second)) == 3, (
+                'Новый узел должен получить свою долю подписок.'
+            )
+            assert not keys(first) & keys(second), (
+                'Подписку должен опрашивать только один узел.'
+            )
+            first.stop()
+            await asyncio.wait_for(running, 5)
+            await asyncio.sleep(1)
+            assert len(keys(second)) == 6, (
+                'Подписки остановленного узла должны перейти к оставшемуся.'
+            )
+            second.stop()
+            await asyncio.wait_for(standby, 5)
+
+        asyncio.run(scenario())
+        polled = {}
+        for node_id, token in polls:
+            polled.setdefault(node_id, set()).add(token)
+        assert len(polled['a']) == 6 and len(polled['b']) == 6
+
+    def test_restart_with_same_node_id_polls_owned_tenants(self, tmp_path):
+        path = tmp_path / 'leases.sqlite3'
+        tenants = [TenantState(f'token{n}', n) for n in range(4)]
+        previous = leases.LeaseStore(path, 'a', ttl=60)
+        previous.claim([tenant.key for tenant in tenants], limit=4)
+        polls = []
+        polling = self.make_engine(path, 'a', tenants, polls)
+
+        async def scenario():
+            running = asyncio.ensure_future(polling.run())
+            await asyncio.sleep(0.5)
+            polling.stop()
+            await asyncio.wait_for(running, 5)
+
+        asyncio.run(scenario())
+        assert len({token for _, token in polls}) == 4, (
+            'После перезапуска узел должен опрашивать подписки, аренды '
+            'которых остались за ним.'
+        )
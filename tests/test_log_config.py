@@ -0,0 +1,70 @@
+import json
+import logging
+
+import pytest
+
+import log_config
+
+
+@pytest.fixture
+def root_logger():
+    root = logging.getLogger()
+    handlers, level = root.handlers[:], root.level
+    yield root
+    root.handlers[:] = handlers
+    root.setLevel(level)
+
+
+class TestSetupLogging:
+    def test_records_written_by_listener(self, tmp_path, root_logger):
+        path = tmp_path / 'main.log'
+        listener = log_config.setup_logging(
+            log_config.file_handler(str(path)), level='DEBUG')
+        logging.getLogger('homework').info('проверка очереди')
+        log_config.stop_logging(listener)
+        assert 'INFO, homework, проверка очереди' in path.read_text(
+            encoding='utf-8')
+
+    def test_caller_only_enqueues(self, tmp_path, root_logger):
+        log_config.setup_logging(
+            log_config.file_handler(str(tmp_path / 'main.log')))
+        assert any(
+            isinstance(handler, logging.handlers.QueueHandler)
+            for handler in root_logger.handlers
+        ), 'Запись в файл не должна выполняться в потоке опроса.'
+
+    def test_json_format(self, tmp_path, root_logger):
+        path = tmp_path / 'main.log'
+        listener = log_config.setup_logging(
+            log_config.file_handler(str(path)), json_format=True)
+        logging.getLogger('homework').error('сбой')
+        log_config.stop_logging(listener)
+        entry = json.loads(path.read_text(encoding='utf-8'))
+        assert entry['level'] == 'ERROR' and entry['message'] == 'сбой'
+
+    def test_json_exception_kept(self, tmp_path, root_logger):
+        path = tmp_path / 'main.log'
+        listener = log_config.setup_logging(
+            log_config.file_handler(str(path)), json_format=True)
+        try:
+            raise ValueError('boom')
+        except ValueError:
+            logging.getLogger('homework').exception('сбой')
+        log_config.stop_logging(listener)
+        entry = json.loads(path.read_text(encoding='utf-8'))
+        assert entry['message'] == 'сбой', (
+            'Трассировка не должна попадать в текст сообщения.'
+        )
+        assert 'ValueError: boom' in entry.get('exception', ''), (
+            'Трассировка должна быть в поле exception.'
+        )
+
+    def test_size_rotation(self, tmp_path, root_logger):
+        path = tmp_path / 'main.log'
+        listener = log_config.setup_logging(log_config.file_handler(
+            str(path), max_bytes=200, backup_count=2))
+        for number in range(50):
+            logging.getLogger('homework').info(f'запись {number}')
+        log_config.stop_logging(listener)
+        assert (tmp_path / 'main.log.1').exists()
+        assert not (tmp_path / 'main.log.3').exists()
@@ -0,0 +1,90 @@
+import urllib.request
+
+import pytest
+
+import metrics
+from state import TenantState
+
+
+class TestRegistry:
+    def test_counter_exposition(self):
+        registry = metrics.Registry()
+        errors = registry.counter('api_errors_total', 'Ошибки', ('type',))
+        errors.inc(type='StatusCodeError')
+        errors.inc(type='StatusCodeError')
+        text = registry.render()
+        assert '# TYPE api_errors_total counter' in text
+        assert 'api_errors_total{type="StatusCodeError"} 2' in text
+
+    def test_histogram_buckets_cumulative(self):
+        registry = metrics.Registry()
+        latency = registry.histogram('latency', 'Время', buckets=(0.1, 1))
+        for value in (0.05, 0.5, 5):
+            latency.observe(value)
+        text = registry.render()
+        assert 'latency_bucket{le="0.1"} 1' in text
+        assert 'latency_bucket{le="1"} 2' in text
+        assert 'latency_bucket{le="+Inf"} 3' in text
+        assert 'latency_count 3' in text
+
+    def test_callback_gauge(self):
+        registry = metrics.Registry()
+        registry.gauge('depth', 'Очередь', callback=lambda: 7)
+        assert 'depth 7' in registry.render()
+
+    def test_staleness_without_series_per_tenant(self):
+        registry = metrics.Registry()
+        tenants = [TenantState('token', chat) for chat in range(3)]
+        tenants[0].last_success -= 600
+        tenants[1].last_success -= 900
+        tenants[1].paused = True
+        metrics.track_tenants(tenants, registry, stale_after=300)
+        text = registry.render()
+        assert 'chat_id' not in text, (
+            'Число рядов метрик не должно расти с числом подписок.'
+        )
+        assert 'homework_stale_tenants 1' in text, (
+            'Подписка на паузе не считается отставшей.'
+        )
+        assert 'homework_max_staleness_seconds 6' in text, (
+            'Подписка на паузе не учитывается в наибольшем отставании.'
+        )
+
+    def test_worker_snapshots_forwarded(self):
+        worker = metrics.Registry()
+        latency = worker.histogram('latency', 'Время', buckets=(1,))
+        latency.observe(0.5)
+        worker.counter('only_worker_total', 'Только в воркере').inc()
+        supervisor = metrics.Registry()
+        supervisor.histogram('latency', 'Время', buckets=(1,))
+        supervisor.forward('worker-1', worker.snapshot())
+        text = supervisor.render()
+        assert text.count('# TYPE latency histogram') == 1, (
+            'Метрика воркера должна выводиться в одном семействе с местной.'
+        )
+        assert 'latency_bucket{worker="worker-1",le="1"} 1' in text
+        assert 'only_worker_total{worker="worker-1"} 1' in text
+        supervisor.forget('worker-1')
+        assert 'worker-1' not in supervisor.render()
+
+    def test_http_endpoint(self):
+        registry = metrics.Registry()
+        registry.gauge('depth', 'Очередь', callback=lambda: 3)
+        server = metrics.start_http_server(0, registry=registry)
+        try:
+            url = f'http://127.0.0.1:{server.server_port}/metrics'
+            with urllib.request.urlopen(url) as response:
+                assert 'depth 3' in response.read().decode()
+        finally:
+            server.shutdown()
+            server.server_close()
+
+
+class TestInstrumentation:
+    def test_validation_failures_counted(self, homework_module):
+        before = metrics.VALIDATION_FAILURES.samples()
+        with pytest.raises(TypeError):
+            homework_module.check_response([{'homeworks': []}])
+        after = metrics.VALIDATION_FAILURES.samples()
+        count = after[0][3] - (before[0][3] if before else 0)
+        assert count == 1, 'Сбой проверки ответа должен учитываться.'
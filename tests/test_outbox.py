@@ -0,0 +1,98 @@
+import asyncio
+import time
+
+from telegram.error import BadRequest, RetryAfter, TimedOut
+
+from outbox import Outbox
+from ratelimit import TokenBucket
+
+
+class ScriptedBot:
+    def __init__(self, failures=()):
+        self.failures = list(failures)
+        self.sent = []
+
+    def send_message(self, chat_id, text):
+        if self.failures:
+            raise self.failures.pop(0)
+        self.sent.append((chat_id, text, time.monotonic()))
+
+
+def deliver(bot, messages, **kwargs):
+    outbox = Outbox(bot, **kwargs)
+
+    async def run():
+        for chat_id, text in messages:
+            outbox.put(chat_id, text)
+        drained = await outbox.drain(timeout=5)
+        await outbox.stop()
+        return drained
+
+    assert asyncio.run(run()), 'Очередь должна опустеть.'
+    return outbox
+
+
+class TestOutbox:
+    def test_chat_order_preserved(self):
+        bot = ScriptedBot()
+        messages = [(1, 'a'), (2, 'x'), (1, 'b'), (1, 'c')]
+        deliver(bot, messages, chat_rate=1000, global_rate=1000)
+        assert [text for chat, text, _ in bot.sent if chat == 1] == [
+            'a', 'b', 'c'
+        ], 'Сообщения одного чата должны уходить по порядку.'
+
+    def test_chat_rate_limited(self):
+        bot = ScriptedBot()
+        deliver(bot, [(1, 'a'), (1, 'b'), (1, 'c')],
+                chat_rate=20, global_rate=1000)
+        elapsed = bot.sent[-1][2] - bot.sent[0][2]
+        assert elapsed >= 0.09, (
+            'Сообщения в один чат не должны уходить чаще лимита.'
+        )
+
+    def test_retry_after_honoured(self):
+        bot = ScriptedBot([RetryAfter(0.1), TimedOut()])
+        started = time.monotonic()
+        outbox = deliver(bot, [(1, 'a')], chat_rate=1000,
+                         global_rate=1000, retry_delay=0.01)
+        assert [text for _, text, _ in bot.sent] == ['a']
+        assert bot.sent[0][2] - started >= 0.1
+        assert outbox.depth == 0
+
+    def test_bad_request_dropped(self):
+        bot = ScriptedBot([BadRequest('chat not found')])
+        outbox = deliver(bot, [(1, 'a'), (1, 'b')],
+                         chat_rate=1000, global_rate=1000)
+        assert [text for _, text, _ in bot.sent] == ['b']
+        assert outbox.depth == 0
+
+    def test_receipts_returned_only_after_send(self):
+        returned = []
+        bot = ScriptedBot([BadRequest('chat not found')])
+        outbox = Outbox(bot, chat_rate=1000, global_rate=1000,
+                        on_sent=returned.extend)
+
+        async def run():
+            outbox.put(1, 'a', ['lost'])
+            outbox.put(1, 'b', ['delivered'])
+            await outbox.drain(timeout=5)
+            outbox.bot = ScriptedBot([RetryAfter(60)])
+            outbox.put(1, 'c', ['waiting'])
+            await outbox.drain(timeout=0.2)
+            await outbox.stop()
+
+        asyncio.run(run())
+        assert returned == ['delivered'], (
+            'Квитанции отдаются, только когда Telegram принял сообщение.'
+        )
+
+
+class TestTokenBucket:
+    def test_refill(self):
+        now = [0.0]
+        bucket = TokenBucket(2, 2, clock=lambda: now[0])
+        assert bucket.try_acquire() and bucket.try_acquire()
+        assert not bucket.try_acquire()
+        assert bucket.delay() == 0.5
+        now[0] = 0.5
+        assert bucket.try_acquire()
@@ -0,0 +1,79 @@
+import asyncio
+import random
+
+import pytest
+
+from exceptions import ApiNotFoundError, CircuitOpenError, StatusCodeError
+from resilience import CircuitBreaker, call_with_retries, decorrelated_jitter
+
+
+def run_with_retries(results, breaker, attempts=3):
+    calls = []
+
+    async def request():
+        calls.append(1)
+        result = results.pop(0)
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    async def no_sleep(delay):
+        pass
+
+    result = asyncio.run(call_with_retries(
+        request, breaker, attempts=attempts, delays=iter([0] * attempts),
+        sleep=no_sleep))
+    return result, len(calls)
+
+
+class TestRetries:
+    def test_transient_errors_retried(self):
+        results = [ApiNotFoundError('timeout'),
+                   StatusCodeError('502', 502), {'homeworks': []}]
+        result, calls = run_with_retries(results, CircuitBreaker())
+        assert result == {'homeworks': []} and calls == 3
+
+    def test_client_errors_not_retried(self):
+        with pytest.raises(StatusCodeError):
+            run_with_retries([StatusCodeError('401', 401)], CircuitBreaker())
+
+    def test_jitter_bounded(self):
+        delays = decorrelated_jitter(1, 10, rng=random.Random(1))
+        values = [next(delays) for _ in range(50)]
+        assert all(1 <= value <= 10 for value in values)
+        assert len(set(values)) > 1, 'Паузы должны быть случайными.'
+
+
+class TestCircuitBreaker:
+    def test_opens_and_half_opens(self):
+        now = [0]
+        breaker = CircuitBreaker(threshold=2, reset_timeout=10, probes=1,
+                                 clock=lambda: now[0])
+        breaker.record_failure()
+        breaker.record_failure()
+        assert not breaker.allow(), (
+            'После серии сбоев запросы должны приостанавливаться.'
+        )
+        now[0] = 10
+        assert breaker.allow(), 'После паузы пропускается пробный запрос.'
+        assert not breaker.allow(), 'Пробных запросов не больше probes.'
+        breaker.record_success()
+        assert breaker.state == CircuitBreaker.CLOSED
+        assert breaker.allow()
+
+    def test_failed_probe_reopens(self):
+        now = [0]
+        breaker = CircuitBreaker(threshold=1, reset_timeout=10,
+                                 clock=lambda: now[0])
+        breaker.record_failure()
+        now[0] = 10
+        assert breaker.allow()
+        breaker.record_failure()
+        assert breaker.state == CircuitBreaker.OPEN
+        assert not breaker.allow()
+
+    def test_open_circuit_short_circuits_requests(self):
+        breaker = CircuitBreaker(threshold=1, reset_timeout=60)
+        breaker.record_failure()
+        with pytest.raises(CircuitOpenError):
+            run_with_retries([{'homeworks': []}], breaker)
@@ -0,0 +1,110 @@
+import time
+from collections import Counter
+
+import engine
+from scheduler import PollPolicy, TimingWheel
+from state import Homework, TenantState
+
+
+class TestPollPolicy:
+    def tenant(self, status=None, idle_cycles=0):
+        tenant = TenantState('token', 1)
+        if status:
+            tenant.homeworks.remember(Homework('hw', 'hw', status))
+        tenant.idle_cycles = idle_cycles
+        return tenant
+
+    def test_default_period(self):
+        policy = PollPolicy(600, idle_cycles=5)
+        assert policy.interval(self.tenant()) == 600
+        assert policy.interval(self.tenant('approved', 5)) == 600
+
+    def test_reviewing_polled_faster(self):
+        policy = PollPolicy(600, reviewing_period=120)
+        assert policy.interval(self.tenant('reviewing', 100)) == 120, (
+            'Пока работа на проверке, опрос должен идти чаще.'
+        )
+
+    def test_idle_backoff_is_exponential_and_capped(self):
+        policy = PollPolicy(600, idle_cycles=5, max_period=3000)
+        intervals = [
+            policy.interval(self.tenant(idle_cycles=cycles))
+            for cycles in (6, 7, 8, 1000)
+        ]
+        assert intervals == [1200, 2400, 3000, 3000]
+
+    def test_budget_limits_interval(self):
+        policy = PollPolicy(600, reviewing_period=60, budget=10)
+        assert policy.interval(self.tenant('reviewing'), 5000) == 500, (
+            'Интервал не должен опускаться ниже допустимого бюджетом.'
+        )
+
+    def test_record_poll_counts_idle_cycles(self):
+        tenant = self.tenant()
+        tenant.record_poll([])
+        tenant.record_poll([])
+        assert tenant.idle_cycles == 2
+        tenant.record_poll([{'homework_name': 'hw'}])
+        assert tenant.idle_cycles == 0
+
+
+class TestTimingWheel:
+    def run_wheel(self, wheel, until, step=0.1):
+        fired = []
+        now = 0.0
+        while now < until:
+            now += step
+            fired += [(key, now) for key, _ in wheel.advance(now)]
+        return fired
+
+    def test_keys_fire_once_in_deadline_order(self):
+        wheel = TimingWheel(tick=0.1)
+        deadlines = {'far': 700.0, 'near': 0.5, 'mid': 30.0, 'hour': 3600.0}
+        for key, when in deadlines.items():
+            wheel.schedule(key, when)
+        fired = self.run_wheel(wheel, 3700)
+        assert [key for key, _ in fired] == ['near', 'mid', 'far', 'hour']
+        for key, when in fired:
+            assert 0 <= when - deadlines[key] < 0.2, (
+                'Ключ должен срабатывать в пределах тика от срока.'
+            )
+        assert len(wheel) == 0
+
+    def test_cancel_and_reschedule(self):
+        wheel = TimingWheel(tick=1)
+        wheel.schedule('a', 10)
+        wheel.schedule('b', 10)
+        wheel.schedule('a', 20)
+        wheel.cancel('b')
+        assert 'b' not in wheel
+        assert self.run_wheel(wheel, 30, step=1) == [('a', 20)], (
+            'Повторная постановка заменяет срок, отменённый ключ не срабатывает.'
+        )
+
+    def test_deadline_beyond_wheel_range(self):
+        wheel = TimingWheel(tick=1, slots=4, levels=2)
+        wheel.schedule('late', 50)
+        assert self.run_wheel(wheel, 60, step=1) == [('late', 50)]
+
+    def test_100k_tenants_spread_evenly(self):
+        period = 600
+        polling = engine.PollingEngine(
+            None, [], engine.Pipeline(None, None, None), period=period)
+        tenants = [TenantState(f'token{n}', n) for n in range(100_000)]
+        wheel = TimingWheel(tick=0.1)
+        started = time.perf_counter()
+        for tenant in tenants:
+            wheel.schedule(tenant.key, polling.phase(tenant))
+        per_second = Counter()
+        now = 0.0
+        while now <= period:
+            now += 0.1
+            per_second[int(now)] += len(wheel.advance(now))
+        elapsed = time.perf_counter() - started
+        assert sum(per_second.values()) == len(tenants)
+        assert max(per_second.values()) < 1.5 * len(tenants) / period, (
+            'Опросы должны равномерно распределяться по периоду.'
+        )
+        assert elapsed < 5, (
+            f'Расписание 100 тыс. подписок заняло {elapsed:.1f} с.'
+        )
@@ -0,0 +1,176 @@
+import asyncio
+import json
+import threading
+from collections import Counter
+
+from telegram.error import RetryAfter
+
+import engine
+import metrics
+import sharding
+from state import Homework, TenantState
+from storage import StateStorage
+
+
+class Response:
+    def __init__(self, data):
+        self.content = json.dumps(data).encode()
+
+    def json(self):
+        return json.loads(self.content)
+
+
+def fetch(headers, timestamp):
+    return Response({
+        'homeworks': [{'homework_name': 'hw', 'status': 'approved'}],
+        'current_date': timestamp,
+    })
+
+
+def check(response):
+    return [Homework(hw['homework_name'], hw['homework_name'], hw['status'])
+            for hw in response['homeworks']]
+
+
+def digest(homeworks):
+    return ', '.join(f'{hw.name}: {hw.status}' for hw in homeworks)
+
+
+class FakeBot:
+    def __init__(self):
+        self.sent = []
+        self.lock = threading.Lock()
+
+    def send_message(self, chat_id, text):
+        with self.lock:
+            self.sent.append(chat_id)
+
+
+class TestHashRing:
+    KEYS = [f'tenant-{number}' for number in range(4000)]
+
+    def test_keys_spread_across_nodes(self):
+        ring = sharding.HashRing(['a', 'b', 'c', 'd'])
+        shares = Counter(ring.node_for(key) for key in self.KEYS)
+        assert all(600 < count < 1400 for count in shares.values()), (
+            f'Подписки должны делиться между воркерами поровну: {shares}'
+        )
+
+    def test_only_removed_node_keys_move(self):
+        ring = sharding.HashRing(['a', 'b', 'c'])
+        before = {key: ring.node_for(key) for key in self.KEYS}
+        ring.remove('b')
+        moved = [key for key in self.KEYS if ring.node_for(key) != before[key]]
+        assert moved and all(before[key] == 'b' for key in moved), (
+            'При уходе воркера должны переезжать только его подписки.'
+        )
+
+    def test_only_keys_of_new_node_move(self):
+        ring = sharding.HashRing(['a', 'b', 'c'])
+        before = {key: ring.node_for(key) for key in self.KEYS}
+        ring.add('d')
+        moved = [key for key in self.KEYS if ring.node_for(key) != before[key]]
+        assert all(ring.node_for(key) == 'd' for key in moved)
+        assert len(moved) < len(self.KEYS) / 2
+
+    def test_same_token_chats_share_worker(self):
+        ring = sharding.HashRing(['a', 'b', 'c', 'd'])
+        tenants = [TenantState('token', chat) for chat in range(6)]
+        nodes = {ring.node_for(sharding.shard_key(tenant.key))
+                 for tenant in tenants}
+        assert len(nodes) == 1, (
+            'Чаты одного студента должен опрашивать один воркер.'
+        )
+
+    def test_worker_count(self):
+        assert sharding.worker_count('3') == 3
+        assert sharding.worker_count('auto') >= 1
+
+
+class TestTenantEntry:
+    def test_state_round_trip(self):
+        tenant = TenantState('token', 42)
+        tenant.timestamp = 100
+        tenant.paused = True
+        tenant.homeworks.remember(Homework('1', 'hw1', 'approved'))
+        copy = sharding.tenant_from_entry(
+            sharding.tenant_entry(tenant, with_state=True))
+        assert (copy.key, copy.timestamp, copy.paused) == (tenant.key, 100, True)
+        assert copy.homeworks.statuses == {'1': 'approved'}
+
+
+class TestSupervisor:
+    def test_worker_death_rebalances_tenants(self, monkeypatch):
+        monkeypatch.setenv('DIGEST_WINDOW', '0')
+        monkeypatch.setenv('SHARD_METRICS_INTERVAL', '0.1')
+        bot = FakeBot()
+        tenants = [TenantState(f'token-{chat}', chat) for chat in range(8)]
+        supervisor = sharding.Supervisor(
+            bot, tenants, engine.Pipeline(fetch, check, digest), period=1,
+            workers=2, restart_delay=0.2, shutdown_timeout=5)
+
+        async def wait_for(condition):
+            for _ in range(200):
+                if condition():
+                    return
+                await asyncio.sleep(0.05)
+            raise AssertionError('Условие не выполнилось за 10 секунд')
+
+        async def scenario():
+            running = asyncio.ensure_future(supervisor.run())
+            await wait_for(lambda: len(set(bot.sent)) == len(tenants))
+            await wait_for(lambda: 'homework_schedule_drift_seconds_count{'
+                           'worker=' in metrics.REGISTRY.render())
+            victim = next(iter(supervisor.workers))
+            supervisor.workers[victim].process.kill()
+            await wait_for(lambda: victim not in supervisor.owners.values())
+            await wait_for(lambda: len(supervisor.workers) == 2
+                           and not supervisor.moving)
+            supervisor.stop()
+            await asyncio.wait_for(running, 15)
+
+        asyncio.run(scenario())
+        assert all(owner in supervisor.workers
+                   for owner in supervisor.owners.values()), (
+            'Подписки умершего воркера должны перейти к живым.'
+        )
+        assert all(supervisor.owners[key]
+                   == supervisor.ring.node_for(sharding.shard_key(key))
+                   for key in supervisor.owners), (
+            'После замены воркера подписки должны лечь по кольцу.'
+        )
+        assert all(not worker.process.is_alive()
+                   for worker in supervisor.workers.values())
+
+    def test_only_delivered_notifications_removed(self, tmp_path):
+        path = tmp_path / 'state.sqlite3'
+        homework = Homework('hw', 'hw', 'approved')
+        storage = StateStorage(path)
+        for tenant_key in ('a', 'b'):
+            storage.stage_unsent(tenant_key, homework)
+        storage.close()
+
+        class Bot:
+            def send_message(self, chat_id, text):
+                if chat_id == 2:
+                    raise RetryAfter(60)
+
+        supervisor = sharding.Supervisor(
+            Bot(), [], engine.Pipeline(fetch, check, digest), period=1,
+            workers=1, storage_path=path)
+
+        async def scenario():
+            supervisor.outbox.start()
+            supervisor._on_result(('send', 1, 'hw', [('a', homework)]))
+            supervisor._on_result(('send', 2, 'hw', [('b', homework)]))
+            await supervisor.outbox.drain(timeout=0.3)
+            await supervisor.outbox.stop()
+
+        asyncio.run(scenario())
+        supervisor.storage.close()
+        rows = StateStorage(path).connection.execute(
+            'SELECT tenant_key FROM unsent').fetchall()
+        assert rows == [('b',)], (
+            'Супервизор снимает с хранения только принятые Telegram '
+            'уведомления.'
+        )
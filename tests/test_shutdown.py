@@ -0,0 +1,39 @@
+import os
+import signal
+import threading
+import time
+
+import pytest
+
+from exceptions import ShutdownRequested
+from shutdown import GracefulExit
+
+
+class TestGracefulExit:
+    def test_signal_interrupts_wait(self):
+        with GracefulExit() as shutdown:
+            timer = threading.Timer(0.1, os.kill, (os.getpid(), signal.SIGTERM))
+            timer.start()
+            started = time.monotonic()
+            with pytest.raises(ShutdownRequested):
+                with shutdown.interruptible():
+                    time.sleep(5)
+        assert time.monotonic() - started < 2, (
+            'Сигнал остановки должен прерывать ожидание сразу.'
+        )
+
+    def test_signal_outside_wait_is_deferred(self):
+        with GracefulExit() as shutdown:
+            os.kill(os.getpid(), signal.SIGTERM)
+            assert shutdown.requested, (
+                'Сигнал во время опроса не должен обрывать запрос.'
+            )
+            with pytest.raises(ShutdownRequested):
+                with shutdown.interruptible():
+                    pass
+
+    def test_previous_handlers_restored(self):
+        previous = signal.getsignal(signal.SIGTERM)
+        with GracefulExit():
+            assert signal.getsignal(signal.SIGTERM) is not previous
+        assert signal.getsignal(signal.SIGTERM) is previous
@@ -0,0 +1,64 @@
+import asyncio
+
+import pytest
+
+from singleflight import SingleFlight
+
+
+class TestSingleFlight:
+    def test_concurrent_calls_share_result(self):
+        flights = SingleFlight()
+        calls = []
+
+        async def fetch():
+            calls.append(1)
+            await asyncio.sleep(0.01)
+            return 'answer'
+
+        async def scenario():
+            results = await asyncio.gather(
+                *(flights.do('key', fetch) for _ in range(5)))
+            again = await flights.do('key', fetch)
+            return results, again
+
+        results, again = asyncio.run(scenario())
+        assert results == ['answer'] * 5
+        assert len(calls) == 2, (
+            'Одновременные вызовы выполняются один раз, следующий — заново.'
+        )
+
+    def test_error_shared(self):
+        flights = SingleFlight()
+
+        async def fail():
+            await asyncio.sleep(0.01)
+            raise ValueError('boom')
+
+        async def scenario():
+            return await asyncio.gather(
+                flights.do('key', fail), flights.do('key', fail),
+                return_exceptions=True)
+
+        errors = asyncio.run(scenario())
+        assert [type(error) for error in errors] == [ValueError] * 2
+        assert errors[0] is errors[1]
+
+    def test_cancelled_waiter_does_not_cancel_call(self):
+        flights = SingleFlight()
+
+        async def fetch():
+            await asyncio.sleep(0.05)
+            return 'answer'
+
+        async def scenario():
+            first = asyncio.ensure_future(flights.do('key', fetch))
+            second = asyncio.ensure_future(flights.do('key', fetch))
+            await asyncio.sleep(0.01)
+            first.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await first
+            return await second
+
+        assert asyncio.run(scenario()) == 'answer', (
+            'Отмена одного ожидающего не должна лишать ответа остальных.'
+        )
@@ -0,0 +1,60 @@
+import json
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Импорт homework на рабочей машине занимает около 30 мс; бюджет
+# с запасом на медленные машины CI, но меньше цены импорта
+# requests и telegram (около 150 мс).
+STARTUP_BUDGET = 0.12
+HEAVY_MODULES = ('telegram', 'requests', 'dotenv', 'http.server')
+
+PROBE = '''
+import json, sys, time
+started = time.perf_counter()
+import homework
+elapsed = time.perf_counter() - started
+if sys.argv[1:] == ['main']:
+    try:
+        homework.main()
+    except SystemExit:
+        pass
+print(json.dumps({{
+    'elapsed': elapsed,
+    'loaded': [name for name in {heavy!r} if name in sys.modules],
+}}))
+'''.format(heavy=HEAVY_MODULES)
+
+
+def probe(*args):
+    env = {
+        key: value for key, value in os.environ.items()
+        if key not in ('PRACTICUM_TOKEN', 'TELEGRAM_TOKEN', 'TELEGRAM_CHAT_ID')
+    }
+    result = subprocess.run(
+        [sys.executable, '-c', PROBE, *args], cwd=ROOT, env=env,
+        capture_output=True, text=True, check=True)
+    return json.loads(result.stdout.splitlines()[-1])
+
+
+class TestStartup:
+    def test_import_does_not_load_heavy_modules(self):
+        assert probe()['loaded'] == [], (
+            'Импорт homework не должен загружать telegram, requests '
+            'и python-dotenv: они нужны только при работе бота.'
+        )
+
+    def test_failed_check_tokens_is_cheap(self):
+        assert probe('main')['loaded'] == [], (
+            'Запуск без переменных окружения должен завершаться '
+            'до загрузки telegram и requests.'
+        )
+
+    def test_import_within_budget(self):
+        elapsed = min(probe()['elapsed'] for _ in range(3))
+        assert elapsed < STARTUP_BUDGET, (
+            f'Импорт homework занял {elapsed * 1000:.0f} мс, '
+            f'бюджет {STARTUP_BUDGET * 1000:.0f} мс.'
+        )
@@ -0,0 +1,95 @@
+from state import (
+    TENANT_MEMORY_BUDGET, Homework, HomeworkStates, TenantState, fingerprint,
+    memory_footprint, next_timestamp,
+)
+
+
+class TestHomeworkStates:
+    def test_every_transition_reported(self):
+        states = HomeworkStates()
+        homeworks = [
+            Homework('2', 'hw2', 'reviewing'),
+            Homework('1', 'hw1', 'approved'),
+        ]
+        changes = states.diff(homeworks)
+        assert [hw.key for hw in changes] == ['1', '2'], (
+            'Должны сообщаться все изменившиеся работы, от старых к новым.'
+        )
+
+    def test_unchanged_status_not_reported(self):
+        states = HomeworkStates()
+        homework = Homework('1', 'hw1', 'reviewing')
+        states.remember(homework)
+        assert states.diff([homework]) == []
+        approved = homework._replace(status='approved')
+        assert states.diff([approved]) == [approved]
+
+    def test_diff_does_not_commit(self):
+        states = HomeworkStates()
+        homework = Homework('hw1', 'hw1', 'approved')
+        states.diff([homework])
+        assert states.diff([homework]) == [homework], (
+            'Статус запоминается только после отправки уведомления.'
+        )
+
+
+class TestNextTimestamp:
+    def test_moves_forward_only(self):
+        assert next_timestamp({'current_date': 20}, 10) == 20
+        assert next_timestamp({'current_date': 5}, 10) == 10
+        assert next_timestamp({}, 10) == 10
+
+
+class TestFingerprint:
+    def test_current_date_ignored(self):
+        first = fingerprint(b'{"homeworks": [], "current_date": 100}')
+        second = fingerprint(b'{"homeworks": [], "current_date": 250}')
+        assert first[0] == second[0]
+        assert (first[1], second[1]) == (100, 250)
+
+    def test_content_change_detected(self):
+        empty = fingerprint(b'{"homeworks": [], "current_date": 1}')
+        changed = fingerprint(
+            b'{"homeworks": [{"status": "approved"}], "current_date": 1}')
+        assert empty[0] != changed[0]
+
+    def test_body_without_current_date(self):
+        digest, current_date = fingerprint(b'{"homeworks": []}')
+        assert current_date is None and len(digest) == 16
+
+
+class TestTenantMemory:
+    TOKEN = 'y0_AgAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAA'
+
+    def test_idle_tenant_within_budget(self, homework_module):
+        tenant = TenantState(self.TOKEN, 123456789)
+        tenant.fingerprint = bytes(16)
+        size = memory_footprint(tenant, homework_module.HOMEWORK_VERDICTS)
+        assert size <= TENANT_MEMORY_BUDGET, (
+            f'Простаивающая подписка занимает {size} байт, '
+            f'бюджет {TENANT_MEMORY_BUDGET}.'
+        )
+
+    def test_statuses_shared_with_verdicts(self, homework_module):
+        records = homework_module.check_response({
+            'homeworks': [{'homework_name': 'hw', 'status': ''.join(
+                ['appr', 'oved'])}],
+            'current_date': 1,
+        })
+        verdict = next(
+            key for key in homework_module.HOMEWORK_VERDICTS
+            if key == 'approved')
+        assert records[0].status is verdict, (
+            'Строки статусов должны быть общими с HOMEWORK_VERDICTS.'
+        )
+
+    def test_tenant_has_no_dict(self):
+        assert not hasattr(TenantState('t', 1), '__dict__')
+
+
+class TestHomeworkNames:
+    def test_name_known_after_change(self):
+        states = HomeworkStates()
+        assert states.name('1') == '1'
+        states.remember(Homework('1', 'hw1.zip', 'approved'))
+        assert states.name('1') == 'hw1.zip'
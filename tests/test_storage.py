@@ -0,0 +1,47 @@
+from state import Homework, TenantState
+from storage import StateStorage
+
+
+class TestStateStorage:
+    HOMEWORK = Homework('7', 'hw7', 'reviewing')
+
+    def test_state_survives_restart(self, tmp_path):
+        path = tmp_path / 'state.sqlite3'
+        storage = StateStorage(path)
+        tenant = TenantState('token', 42)
+        tenant.timestamp = 1234
+        tenant.homeworks.remember(self.HOMEWORK)
+        storage.save(tenant)
+        storage.close()
+
+        restored = TenantState('token', 42)
+        assert StateStorage(path).restore(restored), (
+            'Сохранённая подписка должна восстанавливаться после перезапуска.'
+        )
+        assert restored.timestamp == 1234
+        assert restored.homeworks.diff([self.HOMEWORK]) == [], (
+            'Уже отправленный статус не должен повторяться после перезапуска.'
+        )
+
+    def test_unknown_tenant_not_restored(self, tmp_path):
+        storage = StateStorage(tmp_path / 'state.sqlite3')
+        tenant = TenantState('token', 42)
+        timestamp = tenant.timestamp
+        assert not storage.restore(tenant)
+        assert tenant.timestamp == timestamp
+
+    def test_writes_are_batched(self, tmp_path):
+        storage = StateStorage(tmp_path / 'state.sqlite3')
+        tenants = [TenantState('token', chat) for chat in range(3)]
+        for tenant in tenants:
+            storage.stage(tenant)
+        assert storage.connection.execute(
+            'SELECT COUNT(*) FROM tenants').fetchone()[0] == 0
+        storage.flush()
+        assert storage.connection.execute(
+            'SELECT COUNT(*) FROM tenants').fetchone()[0] == 3
+
+    def test_wal_mode(self, tmp_path):
+        storage = StateStorage(tmp_path / 'state.sqlite3')
+        mode = storage.connection.execute('PRAGMA journal_mode').fetchone()
+        assert mode[0] == 'wal'
@@ -0,0 +1,54 @@
+import pytest
+
+import metrics
+
+
+def failures():
+    samples = metrics.VALIDATION_FAILURES.samples()
+    return samples[0][3] if samples else 0
+
+
+class TestCheckResponseRecords:
+    def test_bad_homework_skipped(self, homework_module, caplog):
+        response = {
+            'homeworks': [
+                {'id': 1, 'homework_name': 'hw1', 'status': 'approved'},
+                {'id': 2, 'homework_name': 'hw2', 'status': 'unknown'},
+            ],
+            'current_date': 1,
+        }
+        before = failures()
+        records = homework_module.check_response(response)
+        assert [record.key for record in records] == ['1'], (
+            'Некорректная работа не должна мешать проверке остальных.'
+        )
+        assert failures() - before == 1
+        assert 'homeworks[1]' in caplog.text, (
+            'В логе должно быть видно, какая именно работа некорректна.'
+        )
+
+    def test_returns_records(self, homework_module):
+        response = {
+            'homeworks': [
+                {'id': 1, 'homework_name': 'hw1', 'status': 'approved'},
+                {'homework_name': 'hw2', 'status': 'rejected'},
+            ],
+            'current_date': 1,
+        }
+        records = homework_module.check_response(response)
+        assert [(r.key, r.name, r.status) for r in records] == [
+            ('1', 'hw1', 'approved'), ('hw2', 'hw2', 'rejected')
+        ]
+        message = homework_module.parse_status(records[0])
+        assert message.endswith(
+            homework_module.HOMEWORK_VERDICTS['approved'])
+
+    def test_item_not_dict(self, homework_module):
+        before = failures()
+        assert homework_module.check_response(
+            {'homeworks': ['hw1'], 'current_date': 1}) == []
+        assert failures() - before == 1
+
+    def test_envelope_error_raised(self, homework_module):
+        with pytest.raises(TypeError):
+            homework_module.check_response({'homeworks': {'id': 1}})